@@ -1,180 +1,252 @@
+import io
+import os
+
 import streamlit as st
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-
+import pyarrow as pa
+
+from charts import errorbar_chart, histograms_chart, metrics_chart, predictions_chart
+from instrumentation import current_session_id, recorder, span, timed
+from live_metrics import LIVE_REFRESH_SECONDS, get_live_store, live_store_error
+from metric_registry import DEFAULT_SUPPLY_CHAIN_SUBHEADER, get_registry
+from monte_carlo import NOISE_DISTRIBUTIONS, run_monte_carlo
+from portfolio import PORTFOLIO_PATH, get_portfolio_impact
+from regression import HISTORY_COLUMNS, fit_model_from_file, get_active_model, save_model, update_model_from_file
+from validation import METRIC_THRESHOLDS, iter_validation_counts, validate_frame
+from warm_cache import start_warmup, warm_cache
+
+# Fill the process-wide warm cache in the background on the first run; later
+# runs only check whether the crisis metrics file changed
+start_warmup()
+
+# Panels showing live metrics refresh on their own while live sources are configured
+live_refresh = LIVE_REFRESH_SECONDS if get_live_store() is not None else None
+
+# Server-side directory whose files may be opened by path from the pages.
+# Without it the path fields are hidden and files can only be uploaded.
+DATA_DIR = os.environ.get("CRISIS_DATA_DIR", "")
+
+
+# Real path of a file typed into a page, or None unless it is a file inside
+# DATA_DIR. Relative paths are taken from DATA_DIR; links are resolved first.
+def data_file_path(path):
+    if not DATA_DIR or not path:
+        return None
+    root = os.path.realpath(DATA_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root or not os.path.isfile(resolved):
+        return None
+    return resolved
+
+
+# Text field for a file in DATA_DIR, shown only when DATA_DIR is set. Returns
+# the resolved path, the configured default as it is, or "" for an empty field
+# or a path outside DATA_DIR. The error is the same whether or not the file
+# exists, so the field cannot be used to probe the server.
+def data_file_input(label, default=""):
+    if not DATA_DIR:
+        return default
+    path = st.text_input(label, default).strip()
+    if not path or path == default:
+        return path
+    resolved = data_file_path(path)
+    if resolved is None:
+        st.error("No such file in the data directory.")
+        return ""
+    return resolved
+
+@timed("chart")
 def plot_metrics(title, metrics, values):
-    fig, ax = plt.subplots()
-    ax.barh(metrics, values, color='skyblue')
-    ax.set_xlabel("Metric Value")
-    ax.set_title(title)
-    st.pyplot(fig)
-
-# Function to define new metrics for tariff impact
-def get_tariff_impact():
-    metrics = ["Supply Chain Efficiency", "Profit Margins", "IT System Costs", "Customer Price Index", "Operational Adaptability"]
-    values = [60, 50, 70, 80, 65]
-    plot_metrics("Tariff Impact Metrics", metrics, values)
-    return """
-    **Tariff Impact Metrics**
-    - **Supply Chain Efficiency**: Measures how well supply chains adapt to increased costs and restrictions.
-    - **Profit Margins**: Assesses the impact of tariffs on profitability and cost structures.
-    - **IT System Costs**: Evaluates increased IT expenses due to compliance and regulatory changes.
-    - **Customer Price Index**: Tracks the influence of tariffs on consumer pricing and demand.
-    - **Operational Adaptability**: Examines the ability of organizations to adjust business models in response to tariffs.
-    """
-
-# Function to define new metrics for war impact
-def get_war_impact():
-    metrics = ["Supply Chain Stability", "Economic Confidence", "Cybersecurity Threat Level", "Workforce Availability", "Regulatory Compliance"]
-    values = [40, 45, 85, 55, 50]
-    plot_metrics("War Impact Metrics", metrics, values)
-    return """
-    **War Impact Metrics**
-    - **Supply Chain Stability**: Evaluates the reliability of supply chains amid geopolitical conflicts.
-    - **Economic Confidence**: Measures investor and consumer trust during wartime.
-    - **Cybersecurity Threat Level**: Assesses risks of cyberattacks and breaches due to conflict.
-    - **Workforce Availability**: Tracks the impact of war on labor force participation and talent retention.
-    - **Regulatory Compliance**: Examines changes in laws and regulations affecting business operations.
-    """
-
-# Function to define new metrics for pandemic impact
-def get_pandemic_impact():
-    metrics = ["Remote Work Efficiency", "Health & Safety Investment", "Supply Chain Reliability", "Market Demand Stability", "Automation Utilization"]
-    values = [75, 90, 50, 60, 85]
-    plot_metrics("Pandemic Impact Metrics", metrics, values)
-    return """
-    **Pandemic Impact Metrics**
-    - **Remote Work Efficiency**: Measures productivity levels in remote work settings.
-    - **Health & Safety Investment**: Evaluates business spending on safety protocols and infrastructure.
-    - **Supply Chain Reliability**: Assesses the ability of supply chains to function amid lockdowns and restrictions.
-    - **Market Demand Stability**: Tracks fluctuations in consumer demand due to health crises.
-    - **Automation Utilization**: Examines the adoption of AI and automation in response to workforce disruptions.
-    """
-
-# Function to define new metrics for recession impact
-def get_recession_impact():
-    metrics = ["Budget Reduction Rate", "Job Stability Index", "Consumer Spending Index", "Market Competition Intensity", "Revenue Diversification"]
-    values = [65, 50, 40, 70, 80]
-    plot_metrics("Recession Impact Metrics", metrics, values)
-    return """
-    **Recession Impact Metrics**
-    - **Budget Reduction Rate**: Measures the rate at which companies cut expenses during economic downturns.
-    - **Job Stability Index**: Assesses the security of employment within various industries.
-    - **Consumer Spending Index**: Tracks changes in household and business spending habits.
-    - **Market Competition Intensity**: Evaluates competitive pressures as companies fight for fewer customers.
-    - **Revenue Diversification**: Measures efforts by businesses to create new income streams.
-    """
-
-
-# Sidebar for company supply chain definitions (Before and After Query)
-def supply_chain_sidebar(crisis_type=None):
-    # Default metrics before any crisis is applied
-    supply_chain_metrics = {
-        "1": "Supply Chain Efficiency: How quickly materials are sourced and distributed.",
-        "2": "Inventory Turnover: Frequency with which inventory is sold and replaced.",
-        "3": "Lead Time: Time taken to fulfill an order from procurement to delivery.",
-        "4": "Cost of Goods Sold: The total cost of producing goods sold by the company.",
-        "5": "Logistics Costs: Expenses related to transporting materials and goods.",
-        "6": "Supplier Relationship Strength: Quality and stability of relationships with suppliers.",
-        "7": "Demand Forecasting Accuracy: Ability to predict customer demand.",
-        "8": "Supply Chain Risk Management: Measures taken to handle potential disruptions.",
-        "9": "Warehouse Utilization: Effectiveness of warehouse space management.",
-        "10": "Sustainability Index: The environmental and social responsibility in the supply chain."
-    }
+    st.image(metrics_chart(title, metrics, values), width="stretch")
 
-    # Update definitions based on the selected crisis type
-    if crisis_type == "Tariffs":
-        st.sidebar.subheader("After Tariff Query: Updated Supply Chain Metrics")
-        supply_chain_metrics["1"] = "Supply Chain Efficiency: Adjusted to include the impact of tariffs on sourcing and transportation costs."
-        supply_chain_metrics["5"] = "Logistics Costs: Revised to account for the rise in transport expenses due to tariff-induced restrictions."
-    elif crisis_type == "War":
-        st.sidebar.subheader("After War Query: Updated Supply Chain Metrics")
-        supply_chain_metrics["6"] = "Supplier Relationship Strength: Changes in supplier relationships due to geopolitical instability."
-        supply_chain_metrics["8"] = "Supply Chain Risk Management: Increased focus on risk management due to potential disruptions caused by conflict."
-    elif crisis_type == "Pandemic":
-        st.sidebar.subheader("After Pandemic Query: Updated Supply Chain Metrics")
-        supply_chain_metrics["3"] = "Lead Time: Extended due to lockdowns and transportation restrictions."
-        supply_chain_metrics["7"] = "Demand Forecasting Accuracy: Increased uncertainty in demand due to shifting consumer behavior during pandemics."
-    elif crisis_type == "Recession":
-        st.sidebar.subheader("After Recession Query: Updated Supply Chain Metrics")
-        supply_chain_metrics["4"] = "Cost of Goods Sold: Increased focus on cost reduction strategies to survive the recession."
-        supply_chain_metrics["9"] = "Warehouse Utilization: More focus on optimizing warehouse space during an economic downturn."
-
-    # Show the current (updated) metrics or initial metrics if no crisis type is selected
-    if crisis_type:
-        for key, value in supply_chain_metrics.items():
-            st.sidebar.write(f"{key}. {value}")
+# Function to plot a crisis' impact metrics and describe them
+def get_crisis_impact(crisis_id):
+    crisis = get_registry().crisis(crisis_id)
+    if get_live_store() is None:
+        plot_metrics(crisis.impact_title, crisis.metric_names, crisis.values)
     else:
-        # Show the default (initial) metrics if no crisis is selected
-        st.sidebar.subheader("Current Supply Chain Metrics")
-        for key, value in supply_chain_metrics.items():
-            st.sidebar.write(f"{key}. {value}")
-
-def quality_assurance_page():
-    st.title("Quality Assurance for Crisis Impact Metrics")
+        live_crisis_chart(crisis_id)
+    return crisis.impact_markdown
+
+# Crisis chart with the latest live value of every metric seen so far. It
+# refreshes on its own, apart from the rest of the crisis panel, and the chart
+# is only redrawn when one of its metrics received events since the last refresh.
+@st.fragment(run_every=live_refresh)
+@timed("chart")
+def live_crisis_chart(crisis_id):
+    live_store = get_live_store()
+    crisis = get_registry().crisis(crisis_id)
+    versions = (crisis_id, live_store.versions(crisis.metric_names))
+    cached = st.session_state.get("live_crisis_chart")
+    if cached is not None and cached[0] == versions:
+        chart = cached[1]
+    else:
+        values = live_store.latest(crisis.metric_names, crisis.values)
+        chart = metrics_chart(crisis.impact_title, crisis.metric_names, values)
+        st.session_state["live_crisis_chart"] = (versions, chart)
+    st.image(chart, width="stretch")
+
+# Portfolio mode: a crisis' impact metrics across every entity of a portfolio
+# file, as distributions and the entities furthest outside their thresholds
+@timed("page")
+def show_portfolio_impact(portfolio_path, crisis_id):
+    crisis = get_registry().crisis(crisis_id)
+    try:
+        impact = get_portfolio_impact(portfolio_path, crisis)
+    except (OSError, ValueError, pa.ArrowException) as e:
+        st.error(f"Could not load the portfolio: {e}")
+        return
+
+    st.write(f"### {crisis.impact_title} across {impact.entities:,} entities")
+    st.image(histograms_chart(f"{crisis.impact_title} Distribution", crisis.metric_names, impact.edges,
+                              impact.histograms, "Metric Value", 'skyblue'), width="stretch")
+    st.write("#### Threshold Breaches per Metric")
+    st.dataframe(impact.summary)
+    # Crises without any threshold rule have no entity outside its thresholds
+    if np.isinf(crisis.thresholds).all():
+        st.write("No threshold rules apply to this crisis' metrics.")
+    else:
+        st.write(f"#### Top {len(impact.worst)} Entities Outside Thresholds")
+        st.dataframe(impact.worst)
+    st.write(crisis.impact_markdown)
 
-    # Generating random data points for the metrics
-    data = {
-        "Metric": ["Supply Chain Efficiency", "Profit Margins", "Logistics Costs",
-                   "Cybersecurity Threat Level", "Economic Confidence",
-                   "Lead Time", "Demand Forecasting Accuracy", "COGS", "Warehouse Utilization"],
-        "Value": np.random.uniform(40, 90, 9),
-        "Threshold Min": [50, 40, 30, 60, 50, 30, 50, 30, 40],
-        "Threshold Max": [80, 70, 60, 90, 75, 60, 80, 60, 75],
-    }
 
-    # Create a DataFrame to display the metrics data
-    df = pd.DataFrame(data)
-    # Function to validate data
-    def validate_metric(row):
-        if row['Value'] < row['Threshold Min']:
-            return "Below Minimum"
-        elif row['Value'] > row['Threshold Max']:
-            return "Above Maximum"
+# Sidebar for company supply chain definitions (Before and After Query)
+@timed("page")
+def supply_chain_sidebar(crisis_id=None, container=st.sidebar):
+    registry = get_registry()
+
+    # Show the updated metrics of the selected crisis, or the pre-crisis baseline if none is selected.
+    # The Dashboard sidebar always shows the baseline; the crisis panel shows the updated metrics.
+    if crisis_id:
+        crisis = registry.crisis(crisis_id)
+        container.subheader(crisis.supply_chain_subheader)
+        lines = crisis.supply_chain_lines
+    else:
+        container.subheader(DEFAULT_SUPPLY_CHAIN_SUBHEADER)
+        container.caption("Before any crisis. A selected crisis' updated metrics are shown under its chart.")
+        lines = registry.default_supply_chain_lines
+    for line in lines:
+        container.write(line)
+
+# Dashboard crisis buttons only record the selection; the panel draws from it
+def select_crisis(crisis_id):
+    st.session_state["selected_crisis"] = crisis_id
+
+# Crisis buttons and the selected crisis' chart (or portfolio distributions),
+# description and updated supply chain metrics. A click reruns this fragment only.
+@st.fragment
+@timed("page")
+def crisis_panel():
+    registry = get_registry()
+    crises = list(registry)
+    with st.expander("Portfolio mode", expanded=bool(PORTFOLIO_PATH)):
+        if DATA_DIR:
+            portfolio_path = data_file_input("Portfolio file in the data directory (Arrow or Parquet), "
+                                             "empty for a single company:", PORTFOLIO_PATH)
+        elif PORTFOLIO_PATH:
+            portfolio_path = PORTFOLIO_PATH if st.checkbox("Show the configured portfolio", value=True) else ""
         else:
-            return "Within Range"
-
-    # Apply the validation function to each row
-    df['Validation'] = df.apply(validate_metric, axis=1)
+            st.write("Set CRISIS_PORTFOLIO_PATH or CRISIS_DATA_DIR to open a portfolio file.")
+            portfolio_path = ""
+    columns = st.columns(2)
+    split = (len(crises) + 1) // 2
+
+    # One button per crisis in the registry, split across two columns
+    for column, column_crises in zip(columns, (crises[:split], crises[split:])):
+        with column:
+            for crisis in column_crises:
+                st.button(crisis.button, on_click=select_crisis, args=(crisis.id,))
+
+    crisis_id = st.session_state.get("selected_crisis")
+    if crisis_id in registry.crises:
+        if portfolio_path:
+            show_portfolio_impact(portfolio_path, crisis_id)
+        else:
+            impact_markdown = get_crisis_impact(crisis_id)
+            with span("crisis_impact_markdown", "render"):
+                st.write(impact_markdown)
+        supply_chain_sidebar(crisis_id, container=st)
+
+# Dashboard query box and its results. Typing reruns this fragment only.
+@st.fragment
+@timed("page")
+def query_panel():
+    st.title("User Query")
+    user_query = st.text_input("Enter a custom query about crisis impact:")
+    if user_query:
+        show_search_results(user_query)
+
+# Metrics table of the Quality Assurance page. With live metrics, the latest
+# values replace the random sample and the table is only rebuilt when one of
+# its metrics received events since the last refresh.
+@st.fragment(run_every=live_refresh)
+@timed("page")
+def qa_metrics_panel():
+    live_store = get_live_store()
+    metrics = list(METRIC_THRESHOLDS)
+    if live_store is not None:
+        versions = live_store.versions(metrics)
+        cached = st.session_state.get("qa_metrics_table")
+        if cached is not None and cached[0] == versions:
+            df = cached[1]
+        else:
+            df = qa_metrics_table()
+            df["Value"] = live_store.latest(df["Metric"], df["Value"])
+            df = validate_frame(df)
+            st.session_state["qa_metrics_table"] = (versions, df)
+    else:
+        df = validate_frame(qa_metrics_table())
 
     # Display the metrics in a table
     st.write("### Metrics Data and Validation")
-    st.dataframe(df)
-# New Metrics Definitions Page
-def show_metrics_definitions():
-    st.title("New Metrics Based on Crisis Events")
-
-    st.write("The following metrics are defined and modified based on different global crises:")
-
-    # Metrics and corresponding logical formulas
-    metrics_info = {
-        "Supply Chain Efficiency": "Measures how effectively the company adapts to disruptions in material sourcing and distribution. \
-        Formula: \( \text{Efficiency} = \frac{\text{Total Output}}{\text{Total Input}} \)",
-
-        "Profit Margins": "This metric assesses how profits change in response to tariffs. \
-        Formula: \( \text{Profit Margin} = \frac{\text{Net Profit}}{\text{Revenue}} \times 100 \)",
-
-        "Lead Time": "Tracks the time it takes for an order to be fulfilled. A crisis could increase this time due to delays in logistics. \
-        Formula: \( \text{Lead Time} = \text{Order Fulfillment Time} \)",
-
-        "Logistics Costs": "This metric quantifies the cost of transporting goods, which increases with tariffs or disruptions. \
-        Formula: \( \text{Logistics Costs} = \text{Transportation Costs} + \text{Storage Costs} \)",
+    with span("metrics_table", "render"):
+        st.dataframe(df)
 
-        "Cybersecurity Threat Level": "Evaluates the risk of cyberattacks during a crisis. \
-        Formula: \( \text{Cybersecurity Threat Level} = \frac{\text{Number of Attacks}}{\text{Total Network Access Points}} \)",
+    if live_store is not None:
+        st.write("### Live Metrics (rolling window)")
+        st.dataframe(live_store.snapshot())
 
-        "Economic Confidence": "Assesses the stability of the economy during crises like war or recession. \
-        Formula: \( \text{Economic Confidence} = \frac{\text{Consumer Spending}}{\text{GDP}} \)"
+# Quality Assurance metrics and thresholds with a random sample of values
+def qa_metrics_table():
+    # Generating random data points for the metrics
+    data = {
+        "Metric": list(METRIC_THRESHOLDS),
+        "Value": np.random.uniform(40, 90, len(METRIC_THRESHOLDS)),
+        "Threshold Min": [minimum for minimum, _ in METRIC_THRESHOLDS.values()],
+        "Threshold Max": [maximum for _, maximum in METRIC_THRESHOLDS.values()],
     }
 
-    for metric, description in metrics_info.items():
-        st.subheader(metric)
-        st.write(description)
-        st.markdown("___")
-    # Streamlit UI
+    # Create a DataFrame to display the metrics data
+    return pd.DataFrame(data)
 
+@timed("page")
+def quality_assurance_page():
+    st.title("Quality Assurance for Crisis Impact Metrics")
 
+    # Metrics validated against their thresholds
+    qa_metrics_panel()
+
+    # Validate exported metric files chunk by chunk
+    st.write("### Validate a Metric File")
+    uploaded_file = st.file_uploader("Upload exported metrics (CSV or Parquet):", type=["csv", "parquet"])
+    file_path = data_file_input("Or enter the path of a metric file in the data directory:")
+    source = uploaded_file if uploaded_file is not None else file_path
+
+    if source and st.button("Validate File"):
+        status = st.empty()
+        counts_table = st.empty()
+        rows = 0
+        try:
+            for rows, counts in iter_validation_counts(source):
+                status.write(f"Validated {rows:,} rows...")
+                counts_table.dataframe(counts)
+        except (OSError, ValueError, pa.ArrowException) as e:
+            st.error(f"Could not validate the metric file: {e}")
+        else:
+            status.write(f"Validated {rows:,} rows.")
+@timed("page")
 def predictive_analytics_page():
     st.title("Predictive Analytics - Pandemic Scenario")
 
@@ -186,6 +258,35 @@ def predictive_analytics_page():
     # Display the ML / DL Model being used
     st.write(
         "**Model Used**: We are using a **Linear Regression** model to predict the change in metrics based on pandemic severity and other influencing factors.")
+    model = get_active_model()
+    if model.version:
+        st.write(f"Model version {model.version}, fitted on {model.n_observations:,} observations.")
+    else:
+        st.write("No fitted model yet: using the default coefficients.")
+
+    # Retrain from a history file, or fold new observations into the current model
+    with st.expander("Model training"):
+        st.write("History files need the columns: " + ", ".join(HISTORY_COLUMNS))
+        history_file = st.file_uploader("Upload a scenario/outcome history file (CSV or Parquet):",
+                                        type=["csv", "parquet"])
+        history_path = data_file_input("Or enter the path of a history file in the data directory:")
+        history = history_file if history_file is not None else history_path
+        retrain = st.button("Retrain Model")
+        update = st.button("Update Model with New Observations")
+        if history and (retrain or update):
+            try:
+                with st.spinner("Training..."):
+                    if retrain:
+                        trained = fit_model_from_file(history)
+                    else:
+                        trained = update_model_from_file(model.copy(), history)
+                    save_model(trained)
+                    warm_cache.invalidate("predictions")
+            except (OSError, ValueError, pa.ArrowException) as e:
+                st.error(f"Could not train the model: {e}")
+            else:
+                model = trained
+                st.success(f"Saved model version {model.version} ({model.n_observations:,} observations).")
 
     # Set up pandemic scenario parameters (sliders for user input)
     pandemic_severity = st.slider("Pandemic Severity (0 - 100)", 0, 100, 50)
@@ -193,6 +294,20 @@ def predictive_analytics_page():
     healthcare_investment = st.slider("Healthcare Investment (0 - 100)", 0, 100, 50)
     lockdown_duration = st.slider("Lockdown Duration (Weeks)", 1, 52, 12)
 
+    # Optional Monte Carlo mode: sample the inputs and coefficients around the sliders
+    uncertainty_mode = st.checkbox("Uncertainty mode (Monte Carlo)")
+    if uncertainty_mode:
+        with st.expander("Noise settings", expanded=True):
+            distribution = st.selectbox("Input noise distribution", NOISE_DISTRIBUTIONS)
+            severity_noise = st.number_input("Pandemic Severity noise", 0.0, 50.0, 5.0)
+            remote_work_noise = st.number_input("Remote Work Factor noise", 0.0, 50.0, 5.0)
+            healthcare_noise = st.number_input("Healthcare Investment noise", 0.0, 50.0, 5.0)
+            lockdown_noise = st.number_input("Lockdown Duration noise (Weeks)", 0.0, 26.0, 2.0)
+            coefficient_noise = st.number_input("Coefficient noise (% of each coefficient)", 0.0, 100.0, 10.0)
+            n_draws = st.select_slider("Number of draws", [1_000_000, 2_000_000, 5_000_000, 10_000_000])
+            seed = st.number_input("Random seed", 0, 2 ** 32 - 1, 0)
+            time_budget = st.number_input("Time budget (seconds)", 1.0, 300.0, 30.0)
+
     # Button to predict impact based on user input
     if st.button("Predict Impact of Pandemic on Business Metrics"):
         st.write(f"### Predicting based on the following parameters:")
@@ -202,122 +317,111 @@ def predictive_analytics_page():
         st.write(f"Lockdown Duration: {lockdown_duration} Weeks")
 
         # Call the predictive function and display the results
-        predictions = predict_pandemic_impact(pandemic_severity, remote_work_factor, healthcare_investment,
-                                              lockdown_duration)
+        predictions = warm_cache.prediction(pandemic_severity, remote_work_factor, healthcare_investment,
+                                            lockdown_duration)
 
         # Display predicted new metrics
         st.write("### Predicted Impact on Business Metrics:")
-        st.write(predictions)
+        with span("predictions_table", "render"):
+            st.write(predictions)
 
         # Plot the predicted metrics
         plot_predictions(predictions)
+
+        if uncertainty_mode:
+            with st.spinner("Sampling scenarios..."):
+                bands, draws, converged = run_monte_carlo(
+                    pandemic_severity, remote_work_factor, healthcare_investment, lockdown_duration,
+                    input_noise=(severity_noise, remote_work_noise, healthcare_noise, lockdown_noise),
+                    distribution=distribution, coefficient_noise=coefficient_noise / 100, n_draws=n_draws,
+                    seed=int(seed), time_budget=time_budget, coefficients=model.coefficients)
+
+            st.write("### Uncertainty Bands (P5 / P50 / P95):")
+            st.write(f"Used {draws:,} draws" + (" (percentiles converged)." if converged else "."))
+            st.write(bands)
+            plot_prediction_bands(bands)
 # Function to plot the predicted impact
+@timed("chart")
 def plot_predictions(predictions):
-    fig, ax = plt.subplots()
-    ax.barh(predictions['Metric'], predictions['Predicted Impact'], color='lightcoral')
-    ax.set_xlabel("Predicted Impact Value")
-    ax.set_title("Predicted Impact on Business Metrics")
-    st.pyplot(fig)
-
-# Function to predict impact based on parameters (simple model simulation)
-def predict_pandemic_impact(severity, remote_work, healthcare_investment, lockdown_duration):
-    # Simulating a simple prediction model (linear regression analogy)
-    # The formula could be more complex in real scenarios
-    supply_chain_impact = max(0,
-                              100 - severity * 0.5 + remote_work * 0.3 - healthcare_investment * 0.2 + lockdown_duration * 0.1)
-    profit_margin_impact = max(0, 50 - severity * 0.4 + healthcare_investment * 0.5 - lockdown_duration * 0.3)
-    logistics_cost_impact = max(0, 60 + severity * 0.6 - remote_work * 0.2 + healthcare_investment * 0.1)
-    remote_work_efficiency_impact = max(0, remote_work * 0.7 + healthcare_investment * 0.2)
-    demand_forecasting_impact = max(0, 70 - severity * 0.5 + healthcare_investment * 0.3)
-
-    # Create a DataFrame to display the results
-    metrics = {
-        "Metric": ["Supply Chain Efficiency", "Profit Margins", "Logistics Costs", "Remote Work Efficiency",
-                   "Demand Forecasting Accuracy"],
-        "Predicted Impact": [supply_chain_impact, profit_margin_impact, logistics_cost_impact,
-                             remote_work_efficiency_impact, demand_forecasting_impact]
-    }
-
-    df = pd.DataFrame(metrics)
+    st.image(predictions_chart(predictions), width="stretch")
 
-    return df
+# Function to plot the Monte Carlo bands as error bars around the median
+@timed("chart")
+def plot_prediction_bands(bands):
+    st.image(errorbar_chart("Predicted Impact Uncertainty (P5 - P95)", bands['Metric'], bands['P50'], bands['P5'],
+                            bands['P95'], "Predicted Impact Value", 'lightcoral'), width="stretch")
 
+# New Metrics Definitions Page
+@timed("page")
 def show_metrics_definitions():
     st.title("New Metrics Based on Crisis Events")
+    registry = get_registry()
 
     # Crisis buttons for selecting the impact type
-    crisis_type = st.radio("Select a Crisis to View Metrics:", ["None", "Tariffs", "War", "Pandemic", "Recession"])
-
-    if crisis_type == "Tariffs":
-        st.subheader("Tariff Impact on Business Metrics")
-        st.write(
-            "When tariffs are imposed, several business metrics are impacted. Below are the formulas and definitions:")
-
-        st.markdown("### 1. **Supply Chain Efficiency**")
-        st.write("Measures how effectively the company adapts to disruptions in material sourcing and distribution.")
-        st.markdown(r"**Formula**: $ \text{Efficiency} = \frac{\text{Total Output}}{\text{Total Input}} $")
+    crisis_label = st.radio("Select a Crisis to View Metrics:", ("None",) + registry.crisis_labels)
+    crisis = registry.by_label(crisis_label)
 
-        st.markdown("### 2. **Profit Margins**")
-        st.write("This metric assesses how profits change in response to tariffs.")
-        st.markdown(r"**Formula**: $ \text{Profit Margin} = \frac{\text{Net Profit}}{\text{Revenue}} \times 100 $")
+    if crisis is not None:
+        st.subheader(crisis.definitions_subheader)
+        st.write(crisis.definitions_intro)
 
-        st.markdown("### 3. **Logistics Costs**")
-        st.write("This metric quantifies the cost of transporting goods, which increases with tariffs.")
-        st.markdown(r"**Formula**: $ \text{Logistics Costs} = \text{Transportation Costs} + \text{Storage Costs} $")
+        for definition in crisis.definitions:
+            st.markdown(definition.heading)
+            st.write(definition.description)
+            st.markdown(definition.formula_markdown)
 
-    elif crisis_type == "War":
-        st.subheader("War Impact on Business Metrics")
-        st.write("War leads to disruptions in business operations in various ways. Below are the metrics impacted:")
-
-        # For War Impact Metrics
-        st.markdown("### 1. **Cybersecurity Threat Level**")
-        st.write("Evaluates the risk of cyberattacks during a crisis like war.")
-        st.markdown(r"**Formula**: $ \text{Threat Level} = \frac{\text{Number of Attacks}}{\text{Total Network Access Points}} $")
-
-        st.markdown("### 2. **Economic Confidence**")
-        st.write("Assesses the stability of the economy during crises like war.")
-        st.markdown(r"**Formula**: $ \text{Economic Confidence} = \frac{\text{Consumer Spending}}{\text{GDP}} $")
-
-    elif crisis_type == "Pandemic":
-        st.subheader("Pandemic Impact on Business Metrics")
-        st.write(
-            "A pandemic disrupts supply chains, workforce availability, and demand forecasting. Here are the key metrics:")
-
-        st.markdown("### 1. **Lead Time**")
-        st.write("Extended due to lockdowns and transportation restrictions.")
-        st.markdown(r"**Formula**: $ \text{Lead Time} = \text{Order Fulfillment Time} $")
-
-        st.markdown("### 2. **Demand Forecasting Accuracy**")
-        st.write("Increased uncertainty in demand due to shifting consumer behavior during pandemics.")
-        st.markdown(
-            r"**Formula**: $ \text{Forecast Accuracy} = \frac{\text{Predicted Demand}}{\text{Actual Demand}} \times 100 $")
-
-
-    elif crisis_type == "Recession":
-        st.subheader("Recession Impact on Business Metrics")
-        st.write(
-            "During a recession, businesses face reduced budgets and altered market behavior. The following metrics are affected:")
+    else:
+        st.write("Select a crisis from the radio buttons above to view its impact on business metrics.")
 
-        st.markdown("### 1. **Cost of Goods Sold (COGS)**")
-        st.write("Increased focus on cost reduction strategies to survive the recession.")
-        st.markdown(r"**Formula**: $ \text{COGS} = \text{Direct Labor} + \text{Direct Materials} $")
-
-        st.markdown("### 2. **Warehouse Utilization**")
-        st.write("More focus on optimizing warehouse space during an economic downturn.")
-        st.markdown(
-            r"**Formula**: $ \text{Utilization Rate} = \frac{\text{Used Space}}{\text{Total Space}} \times 100 $")
 
+# Function to answer the Dashboard query from the search index
+@timed("render")
+def show_search_results(user_query):
+    results = warm_cache.search_index().search(user_query)
+    st.write(f"### Results for \"{user_query}\"")
+    if not results:
+        st.write("No matching metrics found.")
+    for _, document in results:
+        st.markdown(f"**{document['title']}** ({document['source']}): {document['text']}")
+        if "formula" in document:
+            st.markdown(f"**Formula**: $ {document['formula']} $")
+
+# Hidden page with the instrumentation histograms, only listed while recording is on
+def performance_page():
+    st.title("Performance")
+    st.write("Time spent in page functions, charts and computations, as recorded by the instrumentation layer.")
+
+    scope = st.radio("Show histograms for:", ["This session", "All sessions"], horizontal=True)
+    session_id = current_session_id() if scope == "This session" else None
+    summary = recorder.summary(session_id)
+    if summary.empty:
+        st.write("No spans recorded yet. Use the other pages, then come back here.")
     else:
-        st.write("Select a crisis from the radio buttons above to view its impact on business metrics.")
+        st.dataframe(summary)
+        st.bar_chart(summary.set_index("Span")["Total (ms)"], horizontal=True)
+
+    # Recent spans as JSON lines for offline analysis
+    spans = io.StringIO()
+    recorder.export_spans(spans)
+    st.download_button("Export Spans (JSONL)", spans.getvalue(), file_name="spans.jsonl", mime="application/jsonl")
+    if st.button("Reset Histograms"):
+        recorder.reset(session_id)
+        st.rerun()
 
 
 st.set_page_config(page_title="Global Crisis Chatbot", layout="wide")
-page = st.sidebar.selectbox("Select Page", ["Dashboard", "New Metrics Definitions","Quality Assurance","Predictive Analytics"])
+pages = ["Dashboard", "New Metrics Definitions","Quality Assurance","Predictive Analytics"]
+if recorder.enabled:
+    pages.append("Performance")
+page = st.sidebar.selectbox("Select Page", pages)
+if live_store_error() is not None:
+    st.error(f"Live metrics are off, the sources could not be started: {live_store_error()}")
 
 # Show content based on selected page
 if page == "Dashboard":
-    st.sidebar.title("User Query")
-    user_query = st.sidebar.text_input("Enter a custom query about crisis impact:")
+    with st.sidebar:
+        query_panel()
+    supply_chain_sidebar()
 
     st.title("🌎 Global Crisis Impact on Organizations 🏭")
     st.write("Understand how various global crises affect different business processes with key metrics.")
@@ -343,30 +447,12 @@ if page == "Dashboard":
 
     # Set the background image for the app (local image)
     # set_background_image("w.jpg")
-    col1, col2 = st.columns(2)
-
-    with col1:
-        if st.button("Impact of Tariffs💸"):
-            supply_chain_sidebar(crisis_type="Tariffs")
-            st.write(get_tariff_impact())
-        if st.button("Impact of War ⚔"):
-            supply_chain_sidebar(crisis_type="War")
-            st.write(get_war_impact())
-
-    with col2:
-        if st.button("Impact of Pandemics🤒"):
-            supply_chain_sidebar(crisis_type="Pandemic")
-            st.write(get_pandemic_impact())
-        if st.button("Impact of Recessions🧾"):
-            supply_chain_sidebar(crisis_type="Recession")
-            st.write(get_recession_impact())
-
-    # If no button is selected, show the default (initial) metrics in the sidebar
-    if not user_query and not any(st.session_state.get("button_pressed", False) for button in [ "Impact of Tariffs💸", "Impact of War ⚔", "Impact of Pandemics🤒", "Impact of Recessions🧾"]):
-        supply_chain_sidebar()
+    crisis_panel()
 elif page=='New Metrics Definitions':
     show_metrics_definitions()
 elif page == "Quality Assurance":
     quality_assurance_page()
 elif page == "Predictive Analytics":
     predictive_analytics_page()
+elif page == "Performance":
+    performance_page()
@@ -0,0 +1,431 @@
+"""Headless performance benchmarks for the AI.py Streamlit app.
+
+Every page scenario runs several times, each in a fresh Python process through
+Streamlit's AppTest harness, so cold-start numbers include imports and first
+renders. Each one records the median cold-start and warm-up time, warm rerun
+latency percentiles over the reruns of all its processes, websocket bytes per
+rerun, peak RSS and matplotlib figure counts. Micro-benchmarks time
+predict_pandemic_impact, the batch pandemic engine and the QA validation over
+growing data sizes.
+
+Results are written as JSON and compared against a stored baseline; the
+script exits with status 1 when a metric regresses past the tolerance.
+
+    python benchmarks/run_benchmarks.py                  # full run, compare to baseline
+    python benchmarks/run_benchmarks.py --quick          # smaller sizes, fewer reruns
+    python benchmarks/run_benchmarks.py --update-baseline
+"""
+import argparse
+import dataclasses
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+APP_PATH = os.path.join(REPO_DIR, "AI.py")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results.json")
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+
+sys.path.insert(0, REPO_DIR)
+
+DEFAULT_TOLERANCE = 0.25
+
+# Fresh processes per page scenario; cold starts are single samples, so their medians are compared
+DEFAULT_COLD_STARTS = 5
+QUICK_COLD_STARTS = 3
+
+# A latency percentile is only gated when at least this many reruns per page
+# lie beyond it (20 reruns for the median, 100 for p90, 1000 for p99);
+# otherwise it is recorded but moves with one or two slow reruns
+TAIL_SAMPLES = 10
+
+# Differences below these floors are treated as noise, whatever the ratio.
+# Timings also get the spread (max - min) the baseline measured across its
+# processes as a floor: on a busy or single-core host the first render races
+# the warm-up thread, and even the rerun latencies of two processes of the
+# same tree differ by a few milliseconds.
+NOISE_FLOORS = {"_ms": 2.0, "_s": 0.005, "_mb": 8.0, "_bytes": 512, "_figures": 0}
+
+
+def page_scenarios():
+    from metric_registry import get_registry
+
+    scenarios = {
+        "dashboard": ("Dashboard", "rerun"),
+        "new_metrics_definitions": ("New Metrics Definitions", "definitions"),
+        "quality_assurance": ("Quality Assurance", "rerun"),
+        "predictive_analytics": ("Predictive Analytics", "predict"),
+    }
+    for crisis in get_registry():
+        scenarios[f"dashboard_{crisis.id}"] = ("Dashboard", f"crisis:{crisis.id}")
+    return scenarios
+
+
+# ---------------------------------------------------------------------------
+# Page scenarios (run inside a child process)
+# ---------------------------------------------------------------------------
+
+# AppTest always reruns the whole script. The crisis buttons live in an
+# st.fragment, so to measure what a browser click costs the runner is patched
+# to issue a fragment-scoped rerun instead, and to count the bytes of every
+# ForwardMsg it would send over the websocket. AppTest also compiles the script
+# again on every run, where a Streamlit server compiles it once per process, so
+# every runner shares one script cache. This relies on Streamlit internals and
+# may need adjusting on Streamlit upgrades.
+def _install_runner_hooks():
+    import streamlit.testing.v1.app_test as app_test_module
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.scriptrunner_utils.script_requests import ScriptRequestType
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    class BenchmarkScriptRunner(LocalScriptRunner):
+        fragment_id = None
+        sent_bytes = 0
+        button_fragments = {}
+        script_cache = ScriptCache()
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._script_cache = BenchmarkScriptRunner.script_cache
+            enqueue = self.forward_msg_queue.enqueue
+
+            def counting_enqueue(msg):
+                BenchmarkScriptRunner.sent_bytes += msg.ByteSize()
+                if msg.HasField("delta") and msg.delta.fragment_id:
+                    element = msg.delta.new_element
+                    if element.WhichOneof("type") == "button":
+                        BenchmarkScriptRunner.button_fragments[element.button.label] = msg.delta.fragment_id
+                enqueue(msg)
+
+            self.forward_msg_queue.enqueue = counting_enqueue
+
+        def request_rerun(self, rerun_data):
+            if BenchmarkScriptRunner.fragment_id:
+                rerun_data = dataclasses.replace(rerun_data, fragment_id_queue=[BenchmarkScriptRunner.fragment_id],
+                                                 is_fragment_scoped_rerun=True)
+                # A fresh runner starts with a pending full-app rerun that would swallow the fragment one
+                self._requests._state = ScriptRequestType.CONTINUE
+            return super().request_rerun(rerun_data)
+
+    app_test_module.LocalScriptRunner = BenchmarkScriptRunner
+    return BenchmarkScriptRunner
+
+
+# Counts figures created by the page; charts prerendered by the warm cache
+# threads are shared by every session and not counted
+def _install_figure_counter():
+    import matplotlib.figure
+
+    counter = {"created": 0}
+    original_init = matplotlib.figure.Figure.__init__
+
+    def counting_init(self, *args, **kwargs):
+        if not threading.current_thread().name.startswith("WarmCache"):
+            counter["created"] += 1
+        original_init(self, *args, **kwargs)
+
+    matplotlib.figure.Figure.__init__ = counting_init
+    return counter
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _find_button(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(f"No button labelled {label!r}")
+
+
+def run_page_scenario(name, reruns):
+    runner = _install_runner_hooks()
+    figures = _install_figure_counter()
+    from streamlit.testing.v1 import AppTest
+    from metric_registry import get_registry
+
+    page, action = page_scenarios()[name]
+    crisis = get_registry().crisis(action.split(":", 1)[1]) if action.startswith("crisis:") else None
+    definitions = ("None",) + get_registry().crisis_labels
+
+    def interact(at, iteration):
+        if crisis is not None:
+            runner.fragment_id = runner.button_fragments.get(crisis.button)
+            try:
+                _find_button(at, crisis.button).click().run()
+            finally:
+                runner.fragment_id = None
+        elif action == "definitions":
+            at.radio[0].set_value(definitions[iteration % len(definitions)]).run()
+        elif action == "predict":
+            _find_button(at, "Predict Impact of Pandemic on Business Metrics").click().run()
+        else:
+            at.run()
+        if at.exception:
+            raise RuntimeError(f"{name}: {at.exception[0].message}")
+
+    # Cold start as under a plain `streamlit run AI.py`: the app starts filling
+    # the warm cache in the background while the first runs render
+    started = time.perf_counter()
+    at = AppTest.from_file(APP_PATH, default_timeout=120).run()
+    if page != "Dashboard":
+        at.sidebar.selectbox[0].set_value(page).run()
+    interact(at, 0)
+    cold_start = time.perf_counter() - started
+
+    # Time until the warm cache is full, then keep it out of the measured reruns
+    from warm_cache import warm_cache
+
+    warm_cache.wait()
+    warmup = time.perf_counter() - started
+
+    latencies = []
+    sent = []
+    for iteration in range(1, reruns + 1):
+        runner.sent_bytes = 0
+        started = time.perf_counter()
+        interact(at, iteration)
+        latencies.append((time.perf_counter() - started) * 1000)
+        sent.append(runner.sent_bytes)
+
+    import matplotlib.pyplot as plt
+
+    return {
+        "cold_start_ms": cold_start * 1000,
+        "warmup_ms": warmup * 1000,
+        "rerun_latencies_ms": latencies,
+        "rerun_sent_bytes": float(np.median(sent)),
+        "peak_rss_mb": _peak_rss_mb(),
+        "created_figures": figures["created"],
+        "open_pyplot_figures": len(plt.get_fignums()),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Micro-benchmarks
+# ---------------------------------------------------------------------------
+
+def _best_of(function, repeat=3):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def run_micro_benchmarks(quick):
+    import pandas as pd
+
+    from pandemic_model import predict_pandemic_batch
+    from regression import predict_pandemic_impact
+    from validation import METRIC_THRESHOLDS, iter_validation_counts, validate_frame
+
+    sizes = [1_000, 10_000, 100_000] if quick else [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+    rng = np.random.default_rng(0)
+    results = {}
+
+    calls = 200 if quick else 2_000
+    results["predict_pandemic_impact"] = {
+        "per_call_ms": _best_of(lambda: [predict_pandemic_impact(50, 50, 50, 12) for _ in range(calls)]) / calls * 1000
+    }
+
+    batch = {}
+    for size in sizes:
+        params = [rng.uniform(0, 100, size), rng.uniform(0, 100, size), rng.uniform(0, 100, size),
+                  rng.uniform(1, 52, size)]
+        batch[f"{size}_rows_s"] = _best_of(lambda: predict_pandemic_batch(*params))
+    results["predict_pandemic_batch"] = batch
+
+    names = list(METRIC_THRESHOLDS)
+    thresholds = np.array([METRIC_THRESHOLDS[name] for name in names], dtype=np.float64)
+    frame_timings = {}
+    file_timings = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            metric_index = rng.integers(0, len(names), size)
+            frame = pd.DataFrame({
+                "Metric": pd.Categorical.from_codes(metric_index, names),
+                "Value": rng.uniform(20, 100, size),
+                "Threshold Min": thresholds[metric_index, 0],
+                "Threshold Max": thresholds[metric_index, 1],
+            })
+            frame_timings[f"{size}_rows_s"] = _best_of(lambda: validate_frame(frame.copy()))
+
+            path = os.path.join(directory, f"metrics_{size}.parquet")
+            frame[["Metric", "Value"]].to_parquet(path)
+            file_timings[f"{size}_rows_s"] = _best_of(lambda: list(iter_validation_counts(path)), repeat=2)
+            del frame
+    results["validate_frame"] = frame_timings
+    results["validate_metric_file"] = file_timings
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Orchestration and baseline comparison
+# ---------------------------------------------------------------------------
+
+def _run_child(arguments):
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__)] + arguments, cwd=REPO_DIR,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark {' '.join(arguments)} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# Run one page scenario in cold_starts fresh processes. Cold-start, warm-up,
+# bytes and memory figures are medians over the processes, figure counts the
+# worst process, and the latency percentiles are taken over every rerun.
+# Returns (metrics, spread of the timings, bytes and memory across the processes).
+def run_page(name, reruns, cold_starts):
+    runs = [_run_child(["--scenario", name, "--reruns", str(reruns)]) for _ in range(cold_starts)]
+    latencies = [latency for run in runs for latency in run["rerun_latencies_ms"]]
+    medians = ("cold_start_ms", "warmup_ms", "rerun_sent_bytes", "peak_rss_mb")
+    metrics = {metric: float(np.median([run[metric] for run in runs])) for metric in medians}
+    spread = {metric: float(np.ptp([run[metric] for run in runs])) for metric in medians}
+    for percentile in (50, 90, 99):
+        metrics[f"warm_p{percentile}_ms"] = float(np.percentile(latencies, percentile))
+        spread[f"warm_p{percentile}_ms"] = float(np.ptp([np.percentile(run["rerun_latencies_ms"], percentile)
+                                                         for run in runs]))
+    metrics["created_figures"] = max(run["created_figures"] for run in runs)
+    metrics["open_pyplot_figures"] = max(run["open_pyplot_figures"] for run in runs)
+    return metrics, spread
+
+
+def run_all(quick, cold_starts=None):
+    import streamlit
+
+    reruns = 10 if quick else 50
+    if cold_starts is None:
+        cold_starts = QUICK_COLD_STARTS if quick else DEFAULT_COLD_STARTS
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "quick": quick,
+            "cold_starts": cold_starts,
+            "warm_samples": reruns * cold_starts,
+        },
+        "pages": {},
+        "spread": {"pages": {}},
+    }
+    for name in page_scenarios():
+        print(f"page   {name}", file=sys.stderr)
+        results["pages"][name], results["spread"]["pages"][name] = run_page(name, reruns, cold_starts)
+    print("micro  benchmarks", file=sys.stderr)
+    results["micro"] = _run_child(["--micro"] + (["--quick"] if quick else []))
+    return results
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if key in ("meta", "spread"):
+            continue
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name))
+        elif isinstance(value, (int, float)):
+            flat[name] = float(value)
+    return flat
+
+
+def _noise_floor(name):
+    for suffix, floor in NOISE_FLOORS.items():
+        if name.endswith(suffix):
+            return floor
+    return 0.0
+
+
+# Metric suffixes left out of the comparison: the latency percentiles with
+# fewer than TAIL_SAMPLES reruns beyond them in either run
+def ungated_metrics(results, baseline):
+    samples = min(run.get("meta", {}).get("warm_samples", 0) for run in (results, baseline))
+    return tuple(f"warm_p{percentile}_ms" for percentile in (50, 90, 99)
+                 if samples * (100 - percentile) < TAIL_SAMPLES * 100)
+
+
+# Every recorded metric is lower-is-better. Returns (name, baseline, current) regressions.
+def compare(results, baseline, tolerance):
+    current = _flatten(results)
+    ungated = ungated_metrics(results, baseline)
+    spread = _flatten(baseline.get("spread", {}))
+    regressions = []
+    for name, reference in _flatten(baseline).items():
+        if name not in current or name.endswith(ungated):
+            continue
+        value = current[name]
+        if value > reference * (1 + tolerance) and value - reference > max(_noise_floor(name), spread.get(name, 0)):
+            regressions.append((name, reference, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller data sizes and fewer reruns")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to write the results JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative slowdown before a metric counts as a regression")
+    parser.add_argument("--cold-starts", type=int, default=None,
+                        help=f"fresh processes per page scenario (default: {DEFAULT_COLD_STARTS}, "
+                             f"{QUICK_COLD_STARTS} with --quick)")
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--reruns", type=int, default=50, help=argparse.SUPPRESS)
+    parser.add_argument("--micro", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.cold_starts is not None and args.cold_starts < 1:
+        parser.error("--cold-starts must be at least 1")
+
+    # Child processes print one JSON line for the orchestrator
+    if args.scenario:
+        print(json.dumps(run_page_scenario(args.scenario, args.reruns)))
+        return 0
+    if args.micro:
+        print(json.dumps(run_micro_benchmarks(args.quick)))
+        return 0
+
+    results = run_all(args.quick, args.cold_starts)
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Baseline updated at {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get("meta", {}).get("quick") != results["meta"]["quick"]:
+        print("Warning: baseline and results were recorded with different --quick settings")
+
+    for suffix in ungated_metrics(results, baseline):
+        print(f"Not gated: {suffix} (too few reruns per page for this percentile)")
+    regressions = compare(results, baseline, args.tolerance)
+    for name, reference, value in regressions:
+        print(f"REGRESSION {name}: {reference:.4g} -> {value:.4g} ({(value / reference - 1) * 100 if reference else float('inf'):+.0f}%)")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import io
+import threading
+from collections import OrderedDict
+
+import matplotlib
+
+# Charts are only ever rendered to images, so keep the non-interactive backend
+# for the whole process instead of whatever the environment would pick
+matplotlib.use("Agg")
+
+from matplotlib.figure import Figure
+
+from instrumentation import timed
+
+# Same output Streamlit's st.pyplot produces for a figure
+SAVEFIG_OPTIONS = {"format": "png", "dpi": 200, "bbox_inches": "tight"}
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+# Size-bounded LRU of rendered chart images, shared by every session of the process
+class ChartCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        # Images larger than the whole budget are returned to the caller but never kept
+        if len(image) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._entries[key] = image
+            self._bytes += len(image)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+chart_cache = ChartCache()
+
+
+# Draw a horizontal bar chart and return it as PNG bytes. The figure is built
+# outside pyplot's global registry, so it is released as soon as this returns.
+@timed("chart")
+def _render_barh(title, labels, values, xlabel, color):
+    fig = Figure()
+    ax = fig.subplots()
+    ax.barh(labels, values, color=color)
+    ax.set_xlabel(xlabel)
+    ax.set_title(title)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, **SAVEFIG_OPTIONS)
+    return buffer.getvalue()
+
+
+# Cached horizontal bar chart keyed by everything that affects the image
+@timed("chart")
+def barh_chart(title, labels, values, xlabel, color, cache=chart_cache):
+    key = (title, tuple(str(label) for label in labels), tuple(float(value) for value in values), xlabel, color)
+    image = cache.get(key)
+    if image is None:
+        image = _render_barh(title, list(key[1]), list(key[2]), xlabel, color)
+        cache.put(key, image)
+    return image
+
+
+@timed("chart")
+def _render_errorbar(title, labels, centers, lower, upper, xlabel, color):
+    fig = Figure()
+    ax = fig.subplots()
+    ax.barh(labels, centers, color=color,
+            xerr=[[c - l for c, l in zip(centers, lower)], [u - c for c, u in zip(centers, upper)]], capsize=4)
+    ax.set_xlabel(xlabel)
+    ax.set_title(title)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, **SAVEFIG_OPTIONS)
+    return buffer.getvalue()
+
+
+# Cached horizontal bar chart of centers with lower/upper error bars
+@timed("chart")
+def errorbar_chart(title, labels, centers, lower, upper, xlabel, color, cache=chart_cache):
+    key = (title, tuple(str(label) for label in labels), tuple(float(value) for value in centers),
+           tuple(float(value) for value in lower), tuple(float(value) for value in upper), xlabel, color)
+    image = cache.get(key)
+    if image is None:
+        image = _render_errorbar(title, list(key[1]), list(key[2]), list(key[3]), list(key[4]), xlabel, color)
+        cache.put(key, image)
+    return image
+
+
+@timed("chart")
+def _render_histograms(title, labels, edges, counts, xlabel, color):
+    fig = Figure(figsize=(6.4, 0.6 + 1.2 * len(labels)))
+    axes = fig.subplots(len(labels), 1, sharex=True, squeeze=False)[:, 0]
+    # One filled step patch per histogram draws much faster than a bar per bin
+    for ax, label, row in zip(axes, labels, counts):
+        ax.stairs(row, edges, fill=True, color=color)
+        ax.set_title(label, fontsize="small", loc="left")
+    axes[-1].set_xlabel(xlabel)
+    fig.suptitle(title)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, **SAVEFIG_OPTIONS)
+    return buffer.getvalue()
+
+
+# Cached stack of histograms sharing the same bin edges, one per label
+@timed("chart")
+def histograms_chart(title, labels, edges, counts, xlabel, color, cache=chart_cache):
+    key = (title, tuple(str(label) for label in labels), tuple(float(edge) for edge in edges),
+           tuple(tuple(int(count) for count in row) for row in counts), xlabel, color)
+    image = cache.get(key)
+    if image is None:
+        image = _render_histograms(title, list(key[1]), list(key[2]), [list(row) for row in key[3]], xlabel, color)
+        cache.put(key, image)
+    return image
+
+
+# Bar chart of a crisis' impact metrics as the Dashboard draws it
+def metrics_chart(title, metrics, values):
+    return barh_chart(title, metrics, values, "Metric Value", 'skyblue')
+
+
+# Bar chart of a Predicted Impact table as the Predictive Analytics page draws it
+def predictions_chart(predictions):
+    return barh_chart("Predicted Impact on Business Metrics", predictions['Metric'], predictions['Predicted Impact'],
+                      "Predicted Impact Value", 'lightcoral')
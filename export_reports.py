@@ -0,0 +1,343 @@
+import argparse
+import functools
+import hashlib
+import html
+import io
+import json
+import math
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from charts import metrics_chart, predictions_chart
+from metric_registry import REGISTRY_PATH, get_registry
+from pandemic_model import HEALTHCARE_INVESTMENT_RANGE, LOCKDOWN_DURATION_RANGE, REMOTE_WORK_RANGE, SEVERITY_RANGE
+from regression import get_active_model, predict_pandemic_impact
+from validation import METRIC_THRESHOLDS, validate_frame, validate_metric_file
+from warm_cache import DEFAULT_SCENARIO
+
+# Bump when the content or layout of the artifacts changes, so every bundle is rebuilt
+EXPORT_VERSION = 2
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reports")
+TABLE_FORMATS = ("csv", "parquet")
+MANIFEST_NAME = "manifest.json"
+
+# Failures of one scenario that leave the other scenarios exportable
+EXPORT_ERRORS = (OSError, ValueError, pa.ArrowException)
+
+SLIDERS = {
+    "severity": SEVERITY_RANGE,
+    "remote_work": REMOTE_WORK_RANGE,
+    "healthcare_investment": HEALTHCARE_INVESTMENT_RANGE,
+    "lockdown_duration": LOCKDOWN_DURATION_RANGE,
+}
+
+
+# Empty CSV cells are read as NaN
+def _missing(value):
+    return value is None or (not isinstance(value, str) and pd.isna(value)) or str(value).strip() == ""
+
+
+def _scenario_name(scenario):
+    name = scenario.get("name") or "_".join(
+        [scenario["crisis"] or "no_crisis"] + [str(scenario[slider]) for slider in SLIDERS])
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(name)).strip("._") or "scenario"
+
+
+# Fill in defaults and check one scenario: an optional crisis ID, the four
+# Predictive Analytics sliders and an optional metric file to validate
+def normalize_scenario(scenario, registry):
+    crisis = scenario.get("crisis")
+    crisis = None if _missing(crisis) else str(crisis).strip()
+    if crisis is not None and crisis not in registry.crises:
+        raise ValueError(f"Unknown crisis '{crisis}', expected one of: {', '.join(registry.crisis_ids)}")
+    normalized = {"crisis": crisis}
+
+    for (slider, (low, high)), default in zip(SLIDERS.items(), DEFAULT_SCENARIO):
+        value = scenario.get(slider)
+        value = default if _missing(value) else value
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = math.nan
+        # Non-finite values fail the first test, before int() could overflow
+        if not math.isfinite(number) or number != int(number) or not low <= number <= high:
+            raise ValueError(f"{slider} must be a whole number between {low} and {high}, got {value}")
+        normalized[slider] = int(number)
+
+    metrics_file = scenario.get("metrics_file")
+    normalized["metrics_file"] = None if _missing(metrics_file) else str(metrics_file)
+    if normalized["metrics_file"] is not None and not os.path.isfile(normalized["metrics_file"]):
+        raise ValueError(f"Metric file not found: {normalized['metrics_file']}")
+    name = scenario.get("name")
+    normalized["name"] = _scenario_name({**normalized, "name": None if _missing(name) else name})
+    return normalized
+
+
+# Scenarios from a CSV or JSON (list of objects) file with the columns
+# name, crisis, severity, remote_work, healthcare_investment, lockdown_duration
+# and metrics_file; all of them are optional
+def load_scenarios(path, registry):
+    if str(path).lower().endswith(".json"):
+        with open(path, encoding="utf-8") as scenario_file:
+            records = json.load(scenario_file)
+    else:
+        records = pd.read_csv(path, dtype={"name": str, "crisis": str, "metrics_file": str}).to_dict("records")
+    scenarios = [normalize_scenario(record, registry) for record in records]
+
+    names = [scenario["name"] for scenario in scenarios]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Scenario names must be unique: {', '.join(duplicates)}")
+    return scenarios
+
+
+# One scenario per crisis at the default slider values
+def default_scenarios(registry):
+    return [normalize_scenario({"crisis": crisis_id}, registry) for crisis_id in registry.crisis_ids]
+
+
+def _fingerprint(*parts):
+    return hashlib.sha256(json.dumps([EXPORT_VERSION, *parts], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Fingerprints of the inputs shared by every scenario: the crisis metrics file and the active model
+def source_fingerprints():
+    model = get_active_model()
+    return {
+        "registry": _file_digest(REGISTRY_PATH),
+        "model": [model.version, hashlib.sha256(np.ascontiguousarray(model.coefficients).tobytes()).hexdigest()],
+        "thresholds": sorted(METRIC_THRESHOLDS.items()),
+    }
+
+
+def _write_atomic(path, data):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as artifact:
+        artifact.write(data)
+    os.replace(temporary_path, path)
+
+
+def _table_bytes(df, table_format):
+    if table_format == "csv":
+        return df.to_csv(index=False).encode("utf-8")
+    buffer = io.BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+# Artifacts of one scenario bundle, each rebuilt only when its inputs changed
+# since the bundle was last written. Inputs are fingerprinted in manifest.json.
+class _Bundle:
+    def __init__(self, directory, force):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.manifest = {}
+        if not force and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as manifest_file:
+                self.manifest = json.load(manifest_file)
+        self.written = []
+        self.skipped = []
+
+    def artifact(self, filename, fingerprint, build):
+        path = os.path.join(self.directory, filename)
+        if self.manifest.get(filename) == fingerprint and os.path.exists(path):
+            self.skipped.append(filename)
+            return
+        _write_atomic(path, build())
+        self.manifest[filename] = fingerprint
+        self.written.append(filename)
+
+    def table(self, name, fingerprint, build, formats):
+        for table_format in formats:
+            self.artifact(f"{name}.{table_format}", fingerprint, lambda: _table_bytes(build(), table_format))
+
+    def save(self):
+        _write_atomic(self.manifest_path, json.dumps(self.manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+
+def _crisis_frame(crisis):
+    return pd.DataFrame({"Metric": list(crisis.metric_names), "Value": crisis.values,
+                         "Description": list(crisis.descriptions)})
+
+
+# The crisis metrics validated against their thresholds, as on the Quality Assurance page.
+# Metrics without a rule are left blank rather than shown with infinite bounds.
+def _crisis_validation_frame(crisis):
+    thresholds = np.where(np.isinf(crisis.thresholds), np.nan, crisis.thresholds)
+    df = pd.DataFrame({"Metric": list(crisis.metric_names), "Value": crisis.values,
+                       "Threshold Min": thresholds[:, 0], "Threshold Max": thresholds[:, 1]})
+    return validate_frame(df)
+
+
+def _summary_html(scenario, crisis, predictions, validation, file_counts):
+    title = f"Crisis Impact Report: {scenario['name']}"
+    parts = [f"<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>{html.escape(title)}</title></head>\n"
+             f"<body>\n<h1>{html.escape(title)}</h1>"]
+    if crisis is not None:
+        parts.append(f"<h2>{html.escape(crisis.impact_title)}</h2>\n<img src=\"crisis_impact.png\" width=\"640\">")
+        parts.append(_crisis_frame(crisis).to_html(index=False))
+        parts.append("<h3>Quality Assurance</h3>")
+        parts.append(validation.to_html(index=False))
+    parts.append("<h2>Predicted Impact of a Pandemic on Business Metrics</h2>")
+    parts.append(f"<p>Pandemic Severity: {scenario['severity']}%, Remote Work Factor: {scenario['remote_work']}%, "
+                 f"Healthcare Investment: {scenario['healthcare_investment']}%, "
+                 f"Lockdown Duration: {scenario['lockdown_duration']} Weeks</p>")
+    parts.append("<img src=\"predictions.png\" width=\"640\">")
+    parts.append(predictions.to_html(index=False))
+    if file_counts is not None:
+        parts.append(f"<h2>Metric File Validation</h2>\n<p>{html.escape(scenario['metrics_file'])}</p>")
+        parts.append(file_counts.to_html())
+    parts.append("</body>\n</html>\n")
+    return "\n".join(parts).encode("utf-8")
+
+
+# Write (or bring up to date) the report bundle of one scenario. Runs in a
+# worker process; returns (scenario name, artifacts written, artifacts skipped).
+def export_scenario(scenario, output_dir, formats=TABLE_FORMATS, sources=None, force=False):
+    sources = source_fingerprints() if sources is None else sources
+    directory = os.path.join(output_dir, scenario["name"])
+    os.makedirs(directory, exist_ok=True)
+    bundle = _Bundle(directory, force)
+
+    registry = get_registry()
+    crisis = registry.crisis(scenario["crisis"]) if scenario["crisis"] else None
+    sliders = [scenario[slider] for slider in SLIDERS]
+
+    if crisis is not None:
+        crisis_inputs = _fingerprint(crisis.id, sources["registry"])
+        bundle.artifact("crisis_impact.png", crisis_inputs,
+                        lambda: metrics_chart(crisis.impact_title, crisis.metric_names, crisis.values))
+        bundle.table("crisis_impact", crisis_inputs, lambda: _crisis_frame(crisis), formats)
+        bundle.table("quality_assurance", _fingerprint(crisis_inputs, sources["thresholds"]),
+                     lambda: _crisis_validation_frame(crisis), formats)
+
+    prediction_inputs = _fingerprint(sliders, sources["model"])
+    predictions = predict_pandemic_impact(*sliders)
+    bundle.artifact("predictions.png", prediction_inputs, lambda: predictions_chart(predictions))
+    bundle.table("predictions", prediction_inputs, lambda: predictions, formats)
+
+    # The metric file is only read again when one of its artifacts has to be rebuilt
+    @functools.cache
+    def file_counts():
+        return validate_metric_file(scenario["metrics_file"]) if scenario["metrics_file"] else None
+
+    file_inputs = None
+    if scenario["metrics_file"]:
+        stat = os.stat(scenario["metrics_file"])
+        file_inputs = _fingerprint(os.path.abspath(scenario["metrics_file"]), stat.st_mtime_ns, stat.st_size,
+                                   sources["thresholds"])
+        bundle.table("metric_file_validation", file_inputs, lambda: file_counts().reset_index(), formats)
+
+    bundle.artifact("summary.html", _fingerprint(scenario, sources, file_inputs),
+                    lambda: _summary_html(scenario, crisis, predictions,
+                                          _crisis_validation_frame(crisis) if crisis else None, file_counts()))
+    bundle.save()
+    return scenario["name"], bundle.written, bundle.skipped
+
+
+def _write_index(scenarios, output_dir):
+    rows = "\n".join(
+        f"<li><a href=\"{html.escape(scenario['name'])}/summary.html\">{html.escape(scenario['name'])}</a></li>"
+        for scenario in scenarios)
+    page = ("<!DOCTYPE html>\n<html>\n<head><meta charset=\"utf-8\"><title>Crisis Impact Reports</title></head>\n"
+            f"<body>\n<h1>Crisis Impact Reports</h1>\n<ul>\n{rows}\n</ul>\n</body>\n</html>\n")
+    _write_atomic(os.path.join(output_dir, "index.html"), page.encode("utf-8"))
+
+
+# Export every scenario across a process pool and write an index page of the
+# exported ones. A scenario that fails with one of EXPORT_ERRORS is reported
+# and skipped; the others are still exported. Returns the number of artifacts
+# written and skipped and a {scenario name: error} dict of the failures.
+def export_reports(scenarios, output_dir=DEFAULT_OUTPUT_DIR, formats=TABLE_FORMATS, workers=None, force=False,
+                   progress=None, failure=None):
+    os.makedirs(output_dir, exist_ok=True)
+    sources = source_fingerprints()
+    written = skipped = 0
+    failed = {}
+
+    # outcomes yields (scenario, callable returning the export_scenario result or raising its error)
+    def collect(outcomes):
+        nonlocal written, skipped
+        for scenario, result in outcomes:
+            try:
+                name, scenario_written, scenario_skipped = result()
+            except EXPORT_ERRORS as e:
+                failed[scenario["name"]] = e
+                if failure:
+                    failure(scenario["name"], e)
+                continue
+            written += len(scenario_written)
+            skipped += len(scenario_skipped)
+            if progress:
+                progress(name, scenario_written, scenario_skipped)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(scenarios) > 1:
+        # Workers are spawned, as for the Monte Carlo pool, so they start from a clean interpreter
+        with ProcessPoolExecutor(max_workers=min(workers, len(scenarios)),
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(export_scenario, scenario, output_dir, formats, sources, force): scenario
+                       for scenario in scenarios}
+            collect((futures[future], future.result) for future in as_completed(futures))
+    else:
+        collect((scenario, functools.partial(export_scenario, scenario, output_dir, formats, sources, force))
+                for scenario in scenarios)
+
+    _write_index([scenario for scenario in scenarios if scenario["name"] not in failed], output_dir)
+    return written, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export a report bundle (PNG charts, CSV/Parquet tables, HTML summary) per crisis scenario.")
+    parser.add_argument("--scenarios", help="CSV or JSON file of scenarios (default: one per crisis at the "
+                                            "default slider values)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="directory for the report bundles")
+    parser.add_argument("--format", choices=["csv", "parquet", "both"], default="both", help="table format")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="rebuild every artifact, even if unchanged")
+    args = parser.parse_args(argv)
+
+    registry = get_registry()
+    try:
+        scenarios = load_scenarios(args.scenarios, registry) if args.scenarios else default_scenarios(registry)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    formats = TABLE_FORMATS if args.format == "both" else (args.format,)
+
+    def progress(name, written, skipped):
+        print(f"{name}: {len(written)} written, {len(skipped)} unchanged")
+
+    def failure(name, error):
+        print(f"{name}: failed: {error}", file=sys.stderr)
+
+    started = time.perf_counter()
+    written, skipped, failed = export_reports(scenarios, args.output, formats, args.workers, args.force, progress,
+                                              failure)
+    print(f"Exported {len(scenarios) - len(failed)} scenarios to {args.output} in "
+          f"{time.perf_counter() - started:.1f}s ({written} artifacts written, {skipped} unchanged)")
+    if failed:
+        print(f"{len(failed)} scenarios failed: {', '.join(sorted(failed))}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import atexit
+import inspect
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import nullcontext
+from contextvars import ContextVar
+from functools import wraps
+
+import pandas as pd
+
+# Instrumentation is opt-in: set CRISIS_INSTRUMENTATION=1 to record spans from
+# start-up, and CRISIS_SPANS_PATH to also append every finished span to a JSONL file
+ENABLED = os.environ.get("CRISIS_INSTRUMENTATION", "").lower() in ("1", "true", "yes", "on")
+SPANS_PATH = os.environ.get("CRISIS_SPANS_PATH")
+
+DEFAULT_MAX_SPANS = 10_000
+DEFAULT_MAX_SESSIONS = 256
+
+# Log-spaced latency buckets from 1 microsecond to 1000 seconds, plus an
+# underflow and an overflow bucket
+HISTOGRAM_MIN_SECONDS = 1e-6
+BUCKETS_PER_DECADE = 20
+HISTOGRAM_BUCKETS = 9 * BUCKETS_PER_DECADE
+
+SUMMARY_COLUMNS = ["Span", "Category", "Calls", "Mean (ms)", "P50 (ms)", "P90 (ms)", "P99 (ms)", "Max (ms)",
+                   "Total (ms)"]
+
+_parent_span = ContextVar("parent_span", default=None)
+_NO_SPAN = nullcontext()
+_get_script_run_ctx = None
+
+
+# Streamlit session the calling thread is running a script for, or None outside a session.
+# Streamlit is only imported on first use so headless callers never pay for it.
+def current_session_id():
+    global _get_script_run_ctx
+    if _get_script_run_ctx is None:
+        try:
+            from streamlit.runtime.scriptrunner import get_script_run_ctx
+        except ImportError:
+            def get_script_run_ctx(suppress_warning=False):
+                return None
+        _get_script_run_ctx = get_script_run_ctx
+    ctx = _get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+# Fixed-bucket latency histogram: recording is O(1) and histograms of any
+# number of calls take the same memory and merge by adding counts
+class LatencyHistogram:
+    __slots__ = ("category", "counts", "count", "total", "min", "max")
+
+    def __init__(self, category):
+        self.category = category
+        self.counts = [0] * (HISTOGRAM_BUCKETS + 2)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    @staticmethod
+    def _bucket(seconds):
+        if seconds < HISTOGRAM_MIN_SECONDS:
+            return 0
+        return min(int(math.log10(seconds / HISTOGRAM_MIN_SECONDS) * BUCKETS_PER_DECADE) + 1, HISTOGRAM_BUCKETS + 1)
+
+    def record(self, seconds):
+        self.counts[self._bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    # Geometric middle of the bucket the q-th percentile falls into, clamped to the observed range
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                break
+        if bucket == 0:
+            return self.min
+        estimate = HISTOGRAM_MIN_SECONDS * 10 ** ((bucket - 0.5) / BUCKETS_PER_DECADE)
+        return min(max(estimate, self.min), self.max)
+
+
+# Collects timed spans into process-wide and per-session histograms and keeps
+# the most recent spans for export. Disabled recorders are skipped by timed()
+# and span() before any clock is read.
+class SpanRecorder:
+    def __init__(self, enabled=ENABLED, spans_path=SPANS_PATH, max_spans=DEFAULT_MAX_SPANS,
+                 max_sessions=DEFAULT_MAX_SESSIONS):
+        self.enabled = enabled
+        self.spans_path = spans_path
+        self.max_sessions = max_sessions
+        self._process = {}
+        self._sessions = OrderedDict()
+        self._spans = deque(maxlen=max_spans)
+        self._spans_file = None
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def record(self, name, category, started_at, seconds, parent=None, session_id=None):
+        span = {"name": name, "category": category, "start": started_at, "duration_ms": seconds * 1000,
+                "parent": parent, "session": session_id, "thread": threading.current_thread().name}
+        with self._lock:
+            histogram = self._process.get(name)
+            if histogram is None:
+                histogram = self._process[name] = LatencyHistogram(category)
+            histogram.record(seconds)
+
+            if session_id is not None:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    session = self._sessions[session_id] = {}
+                    # Forget the least recently active session beyond the limit
+                    while len(self._sessions) > self.max_sessions:
+                        self._sessions.popitem(last=False)
+                else:
+                    self._sessions.move_to_end(session_id)
+                histogram = session.get(name)
+                if histogram is None:
+                    histogram = session[name] = LatencyHistogram(category)
+                histogram.record(seconds)
+
+            self._spans.append(span)
+
+        # Spans go through one buffered handle under its own lock, so timed
+        # calls never wait on file I/O for the histograms
+        if self.spans_path:
+            line = json.dumps(span) + "\n"
+            with self._file_lock:
+                if self._spans_file is None:
+                    self._spans_file = open(self.spans_path, "a", encoding="utf-8")
+                    atexit.register(self.close)
+                self._spans_file.write(line)
+
+    # Flush and close the spans file; the next span opens it again
+    def close(self):
+        with self._file_lock:
+            if self._spans_file is not None:
+                self._spans_file.close()
+                self._spans_file = None
+
+    # One row per span name: call count, mean and percentile latencies, total time.
+    # Covers every session of the process unless a session ID is given.
+    def summary(self, session_id=None):
+        with self._lock:
+            histograms = self._process if session_id is None else self._sessions.get(session_id, {})
+            rows = [[name, histogram.category, histogram.count, histogram.total / histogram.count * 1000,
+                     histogram.percentile(50) * 1000, histogram.percentile(90) * 1000,
+                     histogram.percentile(99) * 1000, histogram.max * 1000, histogram.total * 1000]
+                    for name, histogram in histograms.items()]
+        return pd.DataFrame(rows, columns=SUMMARY_COLUMNS).sort_values("Total (ms)", ascending=False,
+                                                                          ignore_index=True)
+
+    def spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    # Write the recent spans as JSON lines to a path or an open text file
+    def export_spans(self, destination):
+        lines = "".join(json.dumps(span) + "\n" for span in self.spans())
+        if hasattr(destination, "write"):
+            destination.write(lines)
+        else:
+            with open(destination, "w", encoding="utf-8") as spans_file:
+                spans_file.write(lines)
+
+    # Drop the histograms and spans of one session, or everything
+    def reset(self, session_id=None):
+        with self._lock:
+            if session_id is None:
+                self._process.clear()
+                self._sessions.clear()
+                self._spans.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+
+recorder = SpanRecorder()
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "category", "_started_at", "_start", "_token")
+
+    def __init__(self, recorder, name, category):
+        self.recorder = recorder
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self._token = _parent_span.set(self.name)
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self._start
+        _parent_span.reset(self._token)
+        self.recorder.record(self.name, self.category, self._started_at, seconds, _parent_span.get(),
+                             current_session_id())
+        return False
+
+
+# Time a block of code as one span; a shared no-op context when recording is off
+def span(name, category="compute", recorder=recorder):
+    if not recorder.enabled:
+        return _NO_SPAN
+    return _Span(recorder, name, category)
+
+
+# Decorator timing every call of a function as a span named after it. Each
+# step of a generator function is timed separately, so a streaming loop shows
+# up as one span per chunk. Costs one attribute check per call when recording is off.
+def timed(category="compute", name=None, recorder=recorder):
+    def decorate(func):
+        span_name = name or func.__qualname__
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                iterator = func(*args, **kwargs)
+                try:
+                    while True:
+                        with span(span_name, category, recorder):
+                            try:
+                                item = next(iterator)
+                            except StopIteration as stop:
+                                return stop.value
+                        yield item
+                finally:
+                    iterator.close()
+            return generator_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not recorder.enabled:
+                return func(*args, **kwargs)
+            with _Span(recorder, span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
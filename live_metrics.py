@@ -0,0 +1,354 @@
+import csv
+import json
+import math
+import os
+import socketserver
+import stat
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from validation import METRIC_THRESHOLDS
+
+# Comma-separated live metric sources: paths of append-only metric files,
+# "tcp://127.0.0.1:<port>" or "unix://<socket path>". Nothing is ingested when empty.
+LIVE_METRICS_SOURCES = os.environ.get("LIVE_METRICS_SOURCES", "")
+# Seconds between refreshes of the panels that show live metrics
+LIVE_REFRESH_SECONDS = float(os.environ.get("LIVE_REFRESH_SECONDS", "2"))
+
+DEFAULT_CAPACITY = 1024
+DEFAULT_ALPHA = 0.1
+DEFAULT_POLL_INTERVAL = 0.5
+_READ_SIZE = 1024 * 1024
+_LOCAL_HOSTS = ("127.0.0.1", "localhost")
+
+SNAPSHOT_COLUMNS = ["Metric", "Last", "EWMA", "Rolling Min", "Rolling Max", "Below Minimum", "Above Maximum",
+                    "Events"]
+
+
+# Rolling state of one metric over its last capacity events. Every add is
+# O(1) (amortized for the min/max deques): the ring buffer overwrites the
+# oldest value, breach counts are adjusted for the value leaving the window,
+# and rolling min/max come from monotonic deques of (sequence, value).
+class MetricBuffer:
+    def __init__(self, capacity=DEFAULT_CAPACITY, alpha=DEFAULT_ALPHA, threshold=(-math.inf, math.inf)):
+        self.capacity = capacity
+        self.alpha = alpha
+        self.minimum, self.maximum = threshold
+        # Plain lists: item stores are several times cheaper than on NumPy arrays
+        self.values = [0.0] * capacity
+        self.timestamps = [0.0] * capacity
+        self.events = 0
+        self.last = math.nan
+        self.last_timestamp = math.nan
+        self.ewma = math.nan
+        self.below = 0
+        self.above = 0
+        self._minima = deque()
+        self._maxima = deque()
+
+    def add(self, value, timestamp):
+        sequence = self.events
+        position = sequence % self.capacity
+        if sequence >= self.capacity:
+            # The oldest value leaves the window
+            evicted = self.values[position]
+            if evicted < self.minimum:
+                self.below -= 1
+            elif evicted > self.maximum:
+                self.above -= 1
+            if self._minima[0][0] == sequence - self.capacity:
+                self._minima.popleft()
+            if self._maxima[0][0] == sequence - self.capacity:
+                self._maxima.popleft()
+
+        self.values[position] = value
+        self.timestamps[position] = timestamp
+        if value < self.minimum:
+            self.below += 1
+        elif value > self.maximum:
+            self.above += 1
+        while self._minima and self._minima[-1][1] >= value:
+            self._minima.pop()
+        self._minima.append((sequence, value))
+        while self._maxima and self._maxima[-1][1] <= value:
+            self._maxima.pop()
+        self._maxima.append((sequence, value))
+
+        self.ewma = value if sequence == 0 else self.ewma + self.alpha * (value - self.ewma)
+        self.last = value
+        self.last_timestamp = timestamp
+        self.events = sequence + 1
+
+    @property
+    def rolling_min(self):
+        return self._minima[0][1] if self._minima else math.nan
+
+    @property
+    def rolling_max(self):
+        return self._maxima[0][1] if self._maxima else math.nan
+
+    # Values in the window, oldest first
+    def window(self):
+        if self.events <= self.capacity:
+            return np.array(self.values[:self.events])
+        start = self.events % self.capacity
+        return np.array(self.values[start:] + self.values[:start])
+
+
+# Parse one event line: either JSON {"metric": ..., "value": ..., "timestamp": ...}
+# or CSV "metric,value[,timestamp]". Timestamps are Unix seconds. Returns
+# (metric, value, timestamp or None).
+def parse_event(line):
+    line = line.strip()
+    if not line:
+        raise ValueError("Empty event")
+    if line.startswith("{"):
+        event = json.loads(line)
+        metric, value, timestamp = str(event["metric"]), float(event["value"]), event.get("timestamp")
+    else:
+        fields = next(csv.reader([line]))
+        if len(fields) not in (2, 3):
+            raise ValueError(f"Expected 'metric,value[,timestamp]', got {line!r}")
+        metric, value, timestamp = fields[0], float(fields[1]), fields[2] if len(fields) == 3 else None
+    if not math.isfinite(value):
+        raise ValueError(f"Metric values must be finite, got {value}")
+    if timestamp is not None:
+        timestamp = float(timestamp)
+        if not math.isfinite(timestamp):
+            raise ValueError(f"Timestamps must be finite, got {timestamp}")
+    return metric, value, timestamp
+
+
+# Buffers of every metric seen by the ingestion threads, shared by every
+# session. Each metric carries a version that changes with every event, so a
+# panel can tell whether anything it shows has changed since its last render.
+class LiveMetricStore:
+    def __init__(self, capacity=DEFAULT_CAPACITY, alpha=DEFAULT_ALPHA, thresholds=None):
+        self.capacity = capacity
+        self.alpha = alpha
+        self.thresholds = {} if thresholds is None else thresholds
+        self.rejected = 0
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    def add(self, metric, value, timestamp=None):
+        timestamp = time.time() if timestamp is None else float(timestamp)
+        with self._lock:
+            buffer = self._buffers.get(metric)
+            if buffer is None:
+                buffer = MetricBuffer(self.capacity, self.alpha,
+                                      self.thresholds.get(metric, (-math.inf, math.inf)))
+                self._buffers[metric] = buffer
+            buffer.add(value, timestamp)
+
+    # Ingest one event line; malformed lines are counted and skipped, so no
+    # single event can stop the thread reading its source
+    def ingest_line(self, line):
+        try:
+            metric, value, timestamp = parse_event(line)
+        except Exception:
+            with self._lock:
+                self.rejected += 1
+            return False
+        self.add(metric, value, timestamp)
+        return True
+
+    def __contains__(self, metric):
+        return metric in self._buffers
+
+    def metrics(self):
+        with self._lock:
+            return list(self._buffers)
+
+    # Event counts of the given metrics, 0 for metrics never seen
+    def versions(self, metrics):
+        with self._lock:
+            return tuple(self._buffers[metric].events if metric in self._buffers else 0 for metric in metrics)
+
+    # Last value of each metric, falling back to defaults for metrics never seen
+    def latest(self, metrics, defaults):
+        values = np.array(defaults, dtype=np.float64)
+        with self._lock:
+            for position, metric in enumerate(metrics):
+                buffer = self._buffers.get(metric)
+                if buffer is not None:
+                    values[position] = buffer.last
+        return values
+
+    # One row of rolling aggregates per metric, in the given order (all metrics by default)
+    def snapshot(self, metrics=None):
+        with self._lock:
+            metrics = list(self._buffers) if metrics is None else list(metrics)
+            rows = []
+            for metric in metrics:
+                buffer = self._buffers.get(metric)
+                if buffer is None:
+                    rows.append([metric, np.nan, np.nan, np.nan, np.nan, 0, 0, 0])
+                else:
+                    rows.append([metric, buffer.last, buffer.ewma, buffer.rolling_min, buffer.rolling_max,
+                                 buffer.below, buffer.above, buffer.events])
+        return pd.DataFrame(rows, columns=SNAPSHOT_COLUMNS)
+
+
+# Follow an append-only file from its start, feeding complete lines to the
+# store. A file that shrinks is taken to be rotated and read again from the top.
+class FileTailer(threading.Thread):
+    def __init__(self, store, path, poll_interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(name=f"LiveMetrics.tail({path})", daemon=True)
+        self.store = store
+        self.path = path
+        self.poll_interval = poll_interval
+        self.offset = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def poll(self):
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0
+        if size < self.offset:
+            self.offset = 0
+        if size == self.offset:
+            return 0
+
+        lines = 0
+        with open(self.path, "rb") as metric_file:
+            metric_file.seek(self.offset)
+            pending = b""
+            while True:
+                chunk = metric_file.read(_READ_SIZE)
+                if not chunk:
+                    break
+                pending += chunk
+                # A trailing partial line is left for the next poll
+                complete, _, pending = pending.rpartition(b"\n")
+                if complete:
+                    for line in complete.split(b"\n"):
+                        self.store.ingest_line(line.decode("utf-8", errors="replace"))
+                        lines += 1
+                    self.offset += len(complete) + 1
+        return lines
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                lines = self.poll()
+            except OSError:
+                # Unreadable for now: try again from the same offset on the next poll
+                lines = 0
+            if not lines:
+                self._stop_event.wait(self.poll_interval)
+
+
+class _EventHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            for line in self.rfile:
+                self.server.store.ingest_line(line.decode("utf-8", errors="replace"))
+        except OSError:
+            # The sender went away; other connections keep streaming
+            pass
+
+
+class _Listener:
+    daemon_threads = True
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _TCPListener(_Listener, socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+class _UnixListener(_Listener, socketserver.ThreadingUnixStreamServer):
+    pass
+
+
+# Accept newline-delimited events on a loopback TCP port or a Unix socket
+def start_socket_listener(store, address):
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        if host not in _LOCAL_HOSTS:
+            raise ValueError(f"Live metric sockets must be local, got {address}")
+        server = _TCPListener((host, int(port)), _EventHandler)
+    elif address.startswith("unix://"):
+        path = address[len("unix://"):]
+        try:
+            # Only a socket left behind by an earlier run is replaced, never another file
+            if stat.S_ISSOCK(os.lstat(path).st_mode):
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        server = _UnixListener(path, _EventHandler)
+    else:
+        raise ValueError(f"Unknown live metric socket address: {address}")
+    server.store = store
+    threading.Thread(target=server.serve_forever, name=f"LiveMetrics.listen({address})", daemon=True).start()
+    return server
+
+
+# Start ingesting every source into the store; returns the tailers and servers
+# started. If a source fails to start, the ones already started are stopped.
+def start_ingestion(store, sources):
+    started = []
+    try:
+        for source in sources:
+            if source.startswith(("tcp://", "unix://")):
+                started.append(start_socket_listener(store, source))
+            else:
+                tailer = FileTailer(store, source)
+                tailer.start()
+                started.append(tailer)
+    except BaseException:
+        stop_ingestion(started)
+        raise
+    return started
+
+
+def stop_ingestion(started):
+    for source in started:
+        source.stop()
+
+
+# Threshold rules for live metrics: the Quality Assurance rules, which also bound the crisis metrics
+def live_thresholds():
+    return dict(METRIC_THRESHOLDS)
+
+
+_live_store = None
+_live_store_error = None
+_live_store_lock = threading.Lock()
+
+
+# Store fed from LIVE_METRICS_SOURCES, started once per process on first use.
+# None when no live sources are configured, or when they failed to start; the
+# failure is kept for live_store_error() and not retried.
+def get_live_store(sources=LIVE_METRICS_SOURCES):
+    global _live_store, _live_store_error
+    sources = [source.strip() for source in sources.split(",") if source.strip()]
+    if not sources:
+        return None
+    with _live_store_lock:
+        if _live_store is None and _live_store_error is None:
+            store = LiveMetricStore(thresholds=live_thresholds())
+            try:
+                start_ingestion(store, sources)
+            except (OSError, ValueError) as e:
+                _live_store_error = e
+            else:
+                _live_store = store
+        return _live_store
+
+
+# Why the live sources could not be started, or None
+def live_store_error():
+    return _live_store_error
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+import numpy as np
+
+from validation import METRIC_THRESHOLDS
+
+REGISTRY_PATH = os.environ.get("CRISIS_METRICS_PATH",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "crisis_metrics.json"))
+
+# Heading of the supply chain metrics before any crisis, the baseline every crisis updates
+DEFAULT_SUPPLY_CHAIN_SUBHEADER = "Pre-Crisis Supply Chain Metrics"
+
+# Compiled, read-only view of one crisis type. Everything the pages render is
+# built here once, so a rerun only looks strings up.
+Crisis = namedtuple("Crisis", [
+    "id", "label", "button",
+    "impact_title", "metric_ids", "metric_names", "values", "thresholds", "descriptions", "impact_markdown",
+    "supply_chain_subheader", "supply_chain_updates", "supply_chain_lines",
+    "definitions_subheader", "definitions_intro", "definitions",
+])
+
+# One entry of the New Metrics Definitions page, with its markdown prebuilt
+Definition = namedtuple("Definition", ["name", "description", "formula", "heading", "formula_markdown"])
+
+
+def _require(spec, key, where):
+    if key not in spec:
+        raise ValueError(f"Crisis metrics file: missing '{key}' in {where}")
+    return spec[key]
+
+
+# (min, max) of a metric from the Quality Assurance rules; metrics without a
+# rule have no bounds and are never flagged
+def _threshold(name):
+    return METRIC_THRESHOLDS.get(name, (-np.inf, np.inf))
+
+
+def _supply_chain_line(entry):
+    return f"{entry['key']}. {entry['name']}: {entry['description']}"
+
+
+def _compile_crisis(spec, default_supply_chain):
+    crisis_id = _require(spec, "id", "crisis")
+    where = f"crisis '{crisis_id}'"
+    impact = _require(spec, "impact", where)
+    metrics = _require(impact, "metrics", where)
+    supply_chain = _require(spec, "supply_chain", where)
+    definitions = _require(spec, "definitions", where)
+
+    metric_names = tuple(_require(metric, "name", where) for metric in metrics)
+    descriptions = tuple(_require(metric, "description", where) for metric in metrics)
+    values = np.array([_require(metric, "value", where) for metric in metrics], dtype=np.float64)
+    values.flags.writeable = False
+    thresholds = np.array([_threshold(name) for name in metric_names], dtype=np.float64).reshape(-1, 2)
+    thresholds.flags.writeable = False
+
+    title = _require(impact, "title", where)
+    impact_markdown = "\n" + "\n".join(
+        [f"    **{title}**"] + [f"    - **{name}**: {description}" for name, description in zip(metric_names, descriptions)]
+    ) + "\n    "
+
+    # Crisis updates replace the default supply chain definitions with the same key
+    updates = tuple(supply_chain.get("updates", []))
+    updated = dict(default_supply_chain)
+    for entry in updates:
+        updated[entry["key"]] = entry
+    supply_chain_lines = tuple(_supply_chain_line(entry) for entry in updated.values())
+
+    compiled_definitions = tuple(
+        Definition(entry["name"], entry["description"], entry["formula"],
+                   f"### {number}. **{entry['name']}**", f"**Formula**: $ {entry['formula']} $")
+        for number, entry in enumerate(_require(definitions, "metrics", where), start=1)
+    )
+
+    return Crisis(
+        id=crisis_id,
+        label=_require(spec, "label", where),
+        button=_require(spec, "button", where),
+        impact_title=title,
+        metric_ids=tuple(_require(metric, "id", where) for metric in metrics),
+        metric_names=metric_names,
+        values=values,
+        thresholds=thresholds,
+        descriptions=descriptions,
+        impact_markdown=impact_markdown,
+        supply_chain_subheader=_require(supply_chain, "subheader", where),
+        supply_chain_updates=updates,
+        supply_chain_lines=supply_chain_lines,
+        definitions_subheader=_require(definitions, "subheader", where),
+        definitions_intro=_require(definitions, "intro", where),
+        definitions=compiled_definitions,
+    )
+
+
+# Crisis metrics compiled from the declarative crisis_metrics.json file.
+# Crises are indexed by ID and by label, metrics by (crisis ID, metric ID).
+class MetricRegistry:
+    def __init__(self, spec):
+        default_supply_chain = {entry["key"]: entry for entry in _require(spec, "supply_chain_metrics", "file")}
+        self.default_supply_chain_lines = tuple(_supply_chain_line(entry) for entry in default_supply_chain.values())
+        self.default_supply_chain = tuple(default_supply_chain.values())
+
+        crises = [_compile_crisis(crisis, default_supply_chain) for crisis in _require(spec, "crises", "file")]
+        self.crisis_ids = tuple(crisis.id for crisis in crises)
+        self.crisis_labels = tuple(crisis.label for crisis in crises)
+        if len(set(self.crisis_ids)) != len(crises):
+            raise ValueError("Crisis metrics file: crisis IDs must be unique")
+
+        self.crises = MappingProxyType({crisis.id: crisis for crisis in crises})
+        self._by_label = MappingProxyType({crisis.label: crisis for crisis in crises})
+        self._metric_positions = MappingProxyType({
+            (crisis.id, metric_id): position
+            for crisis in crises for position, metric_id in enumerate(crisis.metric_ids)
+        })
+
+    def __iter__(self):
+        return iter(self.crises.values())
+
+    def __len__(self):
+        return len(self.crises)
+
+    def crisis(self, crisis_id):
+        return self.crises[crisis_id]
+
+    def by_label(self, label):
+        return self._by_label.get(label)
+
+    # (name, value, description) of one metric of a crisis
+    def metric(self, crisis_id, metric_id):
+        crisis = self.crises[crisis_id]
+        position = self._metric_positions[(crisis_id, metric_id)]
+        return crisis.metric_names[position], float(crisis.values[position]), crisis.descriptions[position]
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as spec_file:
+            return cls(json.load(spec_file))
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+# Registry for a crisis metrics file, compiled once per process and shared by every session
+def get_registry(path=REGISTRY_PATH):
+    with _registries_lock:
+        registry = _registries.get(path)
+        if registry is None:
+            registry = MetricRegistry.from_file(path)
+            _registries[path] = registry
+        return registry
+
+
+# Drop compiled registries so the next get_registry call rereads the file
+def reload_registry(path=None):
+    with _registries_lock:
+        if path is None:
+            _registries.clear()
+        else:
+            _registries.pop(path, None)
@@ -0,0 +1,172 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import timed
+from pandemic_model import (HEALTHCARE_INVESTMENT_RANGE, LOCKDOWN_DURATION_RANGE, PANDEMIC_COEFFICIENTS,
+                            PANDEMIC_METRICS, REMOTE_WORK_RANGE, SEVERITY_RANGE,
+                            predict_pandemic_with_coefficients)
+
+# Slider inputs in the column order the model expects
+INPUT_RANGES = np.array([SEVERITY_RANGE, REMOTE_WORK_RANGE, HEALTHCARE_INVESTMENT_RANGE, LOCKDOWN_DURATION_RANGE],
+                        dtype=np.float64)
+NOISE_DISTRIBUTIONS = ["Normal", "Uniform"]
+PERCENTILES = (5, 50, 95)
+
+DEFAULT_BLOCK_SIZE = 100_000
+DEFAULT_TOLERANCE = 0.05
+# Blocks drawn between two convergence checks, whatever the number of workers
+CHECK_INTERVAL = 4
+HISTOGRAM_BINS = 8192
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# Process pool shared by every session. Workers are spawned rather than forked
+# because the Streamlit server that owns them is multi-threaded.
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+# Forget a pool whose worker died so the next wave starts a fresh one
+def _discard_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Draw one block of scenarios around the slider values and evaluate the model.
+# Input noise is a standard deviation (Normal) or a half-width (Uniform) in
+# slider units; coefficient noise is relative to each coefficient.
+def simulate_block(center, input_noise, distribution, coefficient_noise, seed, size,
+                   coefficients=PANDEMIC_COEFFICIENTS):
+    rng = np.random.default_rng(seed)
+    center = np.asarray(center, dtype=np.float64)
+    input_noise = np.asarray(input_noise, dtype=np.float64)
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+
+    if distribution == "Normal":
+        inputs = center + rng.standard_normal((size, center.shape[0])) * input_noise
+    elif distribution == "Uniform":
+        inputs = center + rng.uniform(-1.0, 1.0, (size, center.shape[0])) * input_noise
+    else:
+        raise ValueError(f"Unknown noise distribution: {distribution}")
+    np.clip(inputs, INPUT_RANGES[:, 0], INPUT_RANGES[:, 1], out=inputs)
+
+    if coefficient_noise > 0:
+        coefficients = coefficients * (1 + coefficient_noise * rng.standard_normal((size,) + coefficients.shape))
+    return predict_pandemic_with_coefficients(inputs, coefficients)
+
+
+def _block_histogram(edges, *args):
+    samples = simulate_block(*args)
+    counts = np.empty((samples.shape[1], edges.shape[0] + 1), dtype=np.int64)
+    for metric in range(samples.shape[1]):
+        # np.searchsorted puts values past the last edge into an overflow bin
+        counts[metric] = np.bincount(np.searchsorted(edges, samples[:, metric], side="right"),
+                                     minlength=edges.shape[0] + 1)
+    return counts
+
+
+def _histogram_percentiles(counts, edges):
+    bands = np.empty((counts.shape[0], len(PERCENTILES)))
+    for metric in range(counts.shape[0]):
+        cumulative = np.cumsum(counts[metric])
+        for i, q in enumerate(PERCENTILES):
+            target = q / 100 * cumulative[-1]
+            bin_index = min(int(np.searchsorted(cumulative, target)), edges.shape[0] - 1)
+            # Linear interpolation inside the bin the percentile falls into
+            below = cumulative[bin_index - 1] if bin_index > 0 else 0
+            in_bin = counts[metric, bin_index]
+            low = edges[bin_index - 1] if bin_index > 0 else 0.0
+            fraction = (target - below) / in_bin if in_bin else 0.0
+            bands[metric, i] = low + fraction * (edges[bin_index] - low)
+    return bands
+
+
+# Monte Carlo uncertainty bands for the pandemic model.
+# Draws are made in blocks of block_size, each with its own child of the seed.
+# Blocks run in waves of one block per worker across the process pool, and
+# their histograms are merged in block order. The P5/P50/P95 bands are
+# recomputed every CHECK_INTERVAL blocks; sampling stops once they move by
+# less than tolerance over two checks, so a given seed reproduces the same
+# bands on any number of workers. A time budget (seconds) can cut sampling
+# short between waves, and then the result depends on the host's speed.
+# Returns (bands table, draws used, whether the bands converged).
+@timed("compute")
+def run_monte_carlo(severity, remote_work, healthcare_investment, lockdown_duration, input_noise=(5, 5, 5, 2),
+                    distribution="Normal", coefficient_noise=0.1, n_draws=1_000_000, seed=0, time_budget=None,
+                    block_size=DEFAULT_BLOCK_SIZE, tolerance=DEFAULT_TOLERANCE, workers=None,
+                    coefficients=PANDEMIC_COEFFICIENTS):
+    started = time.perf_counter()
+    center = np.array([severity, remote_work, healthcare_investment, lockdown_duration], dtype=np.float64)
+    input_noise = np.broadcast_to(np.asarray(input_noise, dtype=np.float64), center.shape)
+    n_blocks = max(1, -(-int(n_draws) // block_size))
+    sizes = [block_size] * (n_blocks - 1) + [int(n_draws) - block_size * (n_blocks - 1)]
+    seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # The first block runs in-process and fixes the histogram range for the rest
+    pilot = simulate_block(center, input_noise, distribution, coefficient_noise, seeds[0], sizes[0], coefficients)
+    edges = np.linspace(0.0, max(float(pilot.max()) * 2, 1.0), HISTOGRAM_BINS + 1)[1:]
+    counts = np.zeros((pilot.shape[1], edges.shape[0] + 1), dtype=np.int64)
+    for metric in range(pilot.shape[1]):
+        counts[metric] = np.bincount(np.searchsorted(edges, pilot[:, metric], side="right"),
+                                     minlength=edges.shape[0] + 1)
+    del pilot
+
+    draws = sizes[0]
+    bands = _histogram_percentiles(counts, edges)
+    stable_checks = 0
+    wave_size = max(1, workers)
+    use_pool = workers > 1 and n_blocks > 2
+
+    next_block = 1
+    while next_block < n_blocks and stable_checks < 2:
+        if time_budget is not None and time.perf_counter() - started >= time_budget:
+            break
+        wave = range(next_block, min(next_block + wave_size, n_blocks))
+        args = [(edges, center, input_noise, distribution, coefficient_noise, seeds[i], sizes[i], coefficients)
+                for i in wave]
+        results = None
+        if use_pool:
+            executor = _get_executor()
+            try:
+                results = list(executor.map(_block_histogram, *zip(*args)))
+            except BrokenProcessPool:
+                # A worker died: this wave runs in-process, later waves on a new pool
+                _discard_executor(executor)
+        if results is None:
+            results = (_block_histogram(*block_args) for block_args in args)
+        # Blocks of the wave past the point of convergence are dropped
+        for block, block_counts in zip(wave, results):
+            counts += block_counts
+            draws += sizes[block]
+            next_block = block + 1
+            if next_block % CHECK_INTERVAL == 0 or next_block == n_blocks:
+                previous, bands = bands, _histogram_percentiles(counts, edges)
+                stable_checks = stable_checks + 1 if np.max(np.abs(bands - previous)) < tolerance else 0
+                if stable_checks >= 2:
+                    break
+    if stable_checks < 2:
+        # Stopped by the time budget: the bands cover every block drawn
+        bands = _histogram_percentiles(counts, edges)
+
+    table = pd.DataFrame(bands, columns=[f"P{q}" for q in PERCENTILES])
+    table.insert(0, "Metric", PANDEMIC_METRICS)
+    return table, draws, stable_checks >= 2
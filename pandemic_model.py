@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+# Metrics predicted by the pandemic scenario model, in output column order
+PANDEMIC_METRICS = ["Supply Chain Efficiency", "Profit Margins", "Logistics Costs", "Remote Work Efficiency",
+                    "Demand Forecasting Accuracy"]
+
+# Slider ranges of the Predictive Analytics page (inclusive)
+SEVERITY_RANGE = (0, 100)
+REMOTE_WORK_RANGE = (0, 100)
+HEALTHCARE_INVESTMENT_RANGE = (0, 100)
+LOCKDOWN_DURATION_RANGE = (1, 52)
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+# The same formulas as a coefficient matrix: one row per metric, columns are
+# intercept, severity, remote work, healthcare investment and lockdown duration
+PANDEMIC_COEFFICIENTS = np.array([
+    [100.0, -0.5, 0.3, -0.2, 0.1],
+    [50.0, -0.4, 0.0, 0.5, -0.3],
+    [60.0, 0.6, -0.2, 0.1, 0.0],
+    [0.0, 0.0, 0.7, 0.2, 0.0],
+    [70.0, -0.5, 0.0, 0.3, 0.0],
+])
+
+
+def _as_column(values):
+    return np.atleast_1d(np.asarray(values, dtype=np.float64))
+
+
+# Evaluate one (metrics x 5) coefficient matrix into out, metric by metric:
+# the intercept first, then each input term in column order. That is the
+# evaluation order of the original scalar formulas, so PANDEMIC_COEFFICIENTS
+# reproduces them bit for bit. Terms with a zero coefficient are skipped.
+def _evaluate(columns, coefficients, out):
+    total = np.empty(out.shape[0], dtype=np.float64)
+    term = np.empty_like(total)
+    for metric, row in enumerate(coefficients.tolist()):
+        total.fill(row[0])
+        for column, coefficient in zip(columns, row[1:]):
+            if coefficient:
+                np.multiply(column, coefficient, out=term)
+                total += term
+        out[:, metric] = total
+    np.maximum(out, 0, out=out)
+    return out
+
+
+# Coefficients of the active model: the latest saved fit, or
+# PANDEMIC_COEFFICIENTS while no model has been saved
+def active_coefficients():
+    # regression builds on this module, so it is imported on first use
+    from regression import get_active_model
+    return get_active_model().coefficients
+
+
+def _output_buffer(n, coefficients, out):
+    shape = (n, coefficients.shape[0])
+    if out is None:
+        return np.empty(shape, dtype=np.float64)
+    if out.shape != shape:
+        raise ValueError(f"out must have shape {shape}, got {out.shape}")
+    return out
+
+
+# Compute all five pandemic metrics for arrays of scenarios in one NumPy pass.
+# Inputs are broadcast against each other; the result has one row per scenario
+# and one column per entry of PANDEMIC_METRICS. coefficients defaults to the
+# active model, so every prediction path agrees with the fitted model.
+def predict_pandemic_batch(severity, remote_work, healthcare_investment, lockdown_duration, out=None,
+                           coefficients=None):
+    columns = [column.ravel() for column in np.broadcast_arrays(
+        _as_column(severity), _as_column(remote_work), _as_column(healthcare_investment),
+        _as_column(lockdown_duration))]
+    if coefficients is None:
+        coefficients = active_coefficients()
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    return _evaluate(columns, coefficients, _output_buffer(columns[0].shape[0], coefficients, out))
+
+
+# Evaluate the model with explicit coefficients. inputs has one row per
+# scenario (severity, remote work, healthcare investment, lockdown duration);
+# coefficients is either one (metrics x 5) matrix or one matrix per scenario.
+def predict_pandemic_with_coefficients(inputs, coefficients=PANDEMIC_COEFFICIENTS):
+    inputs = np.asarray(inputs, dtype=np.float64)
+    coefficients = np.asarray(coefficients, dtype=np.float64)
+    if coefficients.ndim == 2:
+        return predict_pandemic_batch(*inputs.T, coefficients=coefficients)
+    out = np.einsum("nmk,nk->nm", coefficients[:, :, 1:], inputs) + coefficients[:, :, 0]
+    np.maximum(out, 0, out=out)
+    return out
+
+
+# Yield chunks of the full cartesian grid of scenario parameters as
+# (severity, remote_work, healthcare_investment, lockdown_duration) arrays.
+# Only one chunk of parameters is materialized at a time.
+def iter_pandemic_grid(severity=None, remote_work=None, healthcare_investment=None, lockdown_duration=None,
+                       chunk_size=DEFAULT_CHUNK_SIZE):
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+
+    axes = [
+        _as_column(np.arange(SEVERITY_RANGE[0], SEVERITY_RANGE[1] + 1) if severity is None else severity),
+        _as_column(np.arange(REMOTE_WORK_RANGE[0], REMOTE_WORK_RANGE[1] + 1) if remote_work is None else remote_work),
+        _as_column(np.arange(HEALTHCARE_INVESTMENT_RANGE[0], HEALTHCARE_INVESTMENT_RANGE[1] + 1)
+                   if healthcare_investment is None else healthcare_investment),
+        _as_column(np.arange(LOCKDOWN_DURATION_RANGE[0], LOCKDOWN_DURATION_RANGE[1] + 1)
+                   if lockdown_duration is None else lockdown_duration),
+    ]
+    shape = tuple(axis.shape[0] for axis in axes)
+    total = int(np.prod(shape, dtype=np.int64))
+
+    for start in range(0, total, chunk_size):
+        flat_index = np.arange(start, min(start + chunk_size, total), dtype=np.int64)
+        grid_index = np.unravel_index(flat_index, shape)
+        yield tuple(axis[index] for axis, index in zip(axes, grid_index))
+
+
+# Run the pandemic model over a parameter grid chunk by chunk, yielding
+# (parameters, predictions) pairs. The prediction buffer is reused between
+# chunks, so callers must copy it if they keep results around. The active
+# model is resolved once, so every chunk uses the same coefficients.
+def iter_pandemic_impact_grid(severity=None, remote_work=None, healthcare_investment=None, lockdown_duration=None,
+                              chunk_size=DEFAULT_CHUNK_SIZE, coefficients=None):
+    if coefficients is None:
+        coefficients = active_coefficients()
+    buffer = None
+    for params in iter_pandemic_grid(severity, remote_work, healthcare_investment, lockdown_duration,
+                                     chunk_size=chunk_size):
+        n = params[0].shape[0]
+        if buffer is None or buffer.shape[0] < n:
+            buffer = np.empty((n, len(PANDEMIC_METRICS)), dtype=np.float64)
+        yield params, predict_pandemic_batch(*params, out=buffer[:n], coefficients=coefficients)
+
+
+# Total number of scenarios covered by a grid
+def pandemic_grid_size(severity=None, remote_work=None, healthcare_investment=None, lockdown_duration=None):
+    sizes = [
+        SEVERITY_RANGE[1] - SEVERITY_RANGE[0] + 1 if severity is None else _as_column(severity).shape[0],
+        REMOTE_WORK_RANGE[1] - REMOTE_WORK_RANGE[0] + 1 if remote_work is None else _as_column(remote_work).shape[0],
+        HEALTHCARE_INVESTMENT_RANGE[1] - HEALTHCARE_INVESTMENT_RANGE[0] + 1
+        if healthcare_investment is None else _as_column(healthcare_investment).shape[0],
+        LOCKDOWN_DURATION_RANGE[1] - LOCKDOWN_DURATION_RANGE[0] + 1
+        if lockdown_duration is None else _as_column(lockdown_duration).shape[0],
+    ]
+    return int(np.prod(sizes, dtype=np.int64))
+
+
+# Wrap batch predictions into the Metric / Predicted Impact table shown on the page
+def predictions_frame(impact):
+    return pd.DataFrame({"Metric": PANDEMIC_METRICS, "Predicted Impact": np.asarray(impact, dtype=np.float64)})
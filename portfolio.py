@@ -0,0 +1,203 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from instrumentation import timed
+from validation import ABOVE_MAXIMUM, BELOW_MINIMUM, VALIDATION_LABELS, classify_values
+
+PORTFOLIO_PATH = os.environ.get("CRISIS_PORTFOLIO_PATH", "")
+
+# A portfolio file has one row per supplier or business unit: an "Entity"
+# name, the entity's pre-crisis value of any crisis metric (column named by
+# metric ID, e.g. "profit_margins") and its exposure to any crisis between 0
+# and 1 (column named by crisis ID plus "_exposure", e.g. "tariffs_exposure").
+# Under a crisis, each metric moves from the entity's own value towards the
+# crisis value charted on the Dashboard in proportion to its exposure:
+#     adjusted = baseline + exposure * (crisis value - baseline)
+# A missing metric column means every entity sits at the crisis value, and
+# without an exposure column the file values are used as they are.
+ENTITY_COLUMN = "Entity"
+EXPOSURE_SUFFIX = "_exposure"
+
+HISTOGRAM_BINS = 20
+HISTOGRAM_RANGE = (0.0, 100.0)
+DEFAULT_TOP_N = 20
+DEFAULT_CHUNK_SIZE = 1_000_000
+_MAX_CACHED_PORTFOLIOS = 4
+_MAX_CACHED_IMPACTS = 64
+
+# Aggregates of one crisis over a whole portfolio: per-metric histograms over
+# edges, a per-metric threshold summary and the entities furthest outside
+# their thresholds
+PortfolioImpact = namedtuple("PortfolioImpact", ["crisis_id", "entities", "edges", "histograms", "summary", "worst"])
+
+
+def _is_parquet(source):
+    name = str(source).lower()
+    return name.endswith((".parquet", ".pq"))
+
+
+# Open a portfolio as an Arrow table backed by a memory map of the file. Arrow
+# IPC (Feather) files are used in place; Parquet pages are decoded into Arrow
+# buffers. Either way no row becomes a Python object.
+def read_portfolio(path):
+    if _is_parquet(path):
+        table = pq.read_table(path, memory_map=True)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    if ENTITY_COLUMN not in table.column_names:
+        raise ValueError(f"Portfolio files need an '{ENTITY_COLUMN}' column")
+    return table
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+_portfolios = OrderedDict()
+_portfolios_lock = threading.Lock()
+
+
+# Portfolio table for a file, opened once per version of the file and shared
+# by every session. Only the most recently used files are kept open.
+def get_portfolio(path):
+    stamp = _file_stamp(path)
+    with _portfolios_lock:
+        cached = _portfolios.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, read_portfolio(path))
+            _portfolios[path] = cached
+        _portfolios.move_to_end(path)
+        while len(_portfolios) > _MAX_CACHED_PORTFOLIOS:
+            _portfolios.popitem(last=False)
+        return cached[1]
+
+
+def _float_column(batch, name, fill):
+    index = batch.schema.get_field_index(name)
+    if index < 0:
+        return None
+    column = batch.column(index)
+    if column.null_count:
+        column = pc.fill_null(column.cast(pa.float64()), fill)
+    # Zero-copy view for float64 columns without nulls
+    return column.cast(pa.float64()).to_numpy(zero_copy_only=False)
+
+
+# Crisis-adjusted values of one record batch, one row per crisis metric so
+# every metric is a contiguous array
+def _adjusted_values(batch, crisis):
+    adjusted = np.empty((len(crisis.metric_ids), batch.num_rows))
+    exposure = _float_column(batch, crisis.id + EXPOSURE_SUFFIX, 0.0)
+    if exposure is not None:
+        exposure = np.clip(exposure, 0.0, 1.0)
+
+    for position, (metric_id, reference) in enumerate(zip(crisis.metric_ids, crisis.values)):
+        column = adjusted[position]
+        baseline = _float_column(batch, metric_id, reference)
+        if baseline is None:
+            column[:] = reference
+        elif exposure is None:
+            column[:] = baseline
+        else:
+            np.subtract(reference, baseline, out=column)
+            column *= exposure
+            column += baseline
+        # Unusable baselines (NaN) fall back to the crisis value
+        np.copyto(column, reference, where=np.isnan(column))
+    return adjusted
+
+
+# Apply a crisis to every entity of a portfolio table, one record batch at a
+# time with column operations, and return its aggregates. Memory stays bounded
+# by chunk_size; only the top_n worst entities are turned into Python values.
+@timed("compute")
+def portfolio_impact(table, crisis, top_n=DEFAULT_TOP_N, chunk_size=DEFAULT_CHUNK_SIZE):
+    n_metrics = len(crisis.metric_ids)
+    edges = np.linspace(*HISTOGRAM_RANGE, HISTOGRAM_BINS + 1)
+    histograms = np.zeros((n_metrics, HISTOGRAM_BINS), dtype=np.int64)
+    counts = np.zeros((n_metrics, len(VALIDATION_LABELS)), dtype=np.int64)
+    totals = np.zeros(n_metrics)
+    offsets = np.arange(n_metrics)[:, None]
+    minimum, maximum = crisis.thresholds[:, :1], crisis.thresholds[:, 1:]
+    candidates = []
+
+    for batch in table.to_batches(max_chunksize=chunk_size):
+        if batch.num_rows == 0:
+            continue
+        adjusted = _adjusted_values(batch, crisis)
+        totals += adjusted.sum(axis=1)
+
+        # Values outside the histogram range are counted in the first or last bin
+        scaled = adjusted - HISTOGRAM_RANGE[0]
+        scaled *= HISTOGRAM_BINS / (HISTOGRAM_RANGE[1] - HISTOGRAM_RANGE[0])
+        np.clip(scaled, 0, HISTOGRAM_BINS - 1, out=scaled)
+        bins = scaled.astype(np.int64)
+        bins += offsets * HISTOGRAM_BINS
+        histograms += np.bincount(bins.ravel(), minlength=histograms.size).reshape(histograms.shape)
+
+        codes = classify_values(adjusted, minimum, maximum)
+        counts += np.bincount((codes + offsets * len(VALIDATION_LABELS)).ravel(),
+                              minlength=counts.size).reshape(counts.shape)
+
+        # Distance outside the thresholds, summed over the metrics, ranks the entities
+        below = np.subtract(minimum, adjusted, out=scaled)
+        np.maximum(below, 0, out=below)
+        shortfall = below.sum(axis=0)
+        above = np.subtract(adjusted, maximum, out=scaled)
+        np.maximum(above, 0, out=above)
+        shortfall += above.sum(axis=0)
+        worst = np.flatnonzero(shortfall)
+        if worst.shape[0] > top_n:
+            worst = worst[np.argpartition(-shortfall[worst], top_n - 1)[:top_n]]
+        if worst.shape[0]:
+            names = batch.column(batch.schema.get_field_index(ENTITY_COLUMN)).take(pa.array(worst))
+            breaches = (codes[:, worst] == BELOW_MINIMUM) | (codes[:, worst] == ABOVE_MAXIMUM)
+            candidates.append((names.to_pylist(), shortfall[worst], breaches.sum(axis=0), adjusted[:, worst].T))
+
+    entities = table.num_rows
+    summary = pd.DataFrame(counts, columns=VALIDATION_LABELS)
+    summary.insert(0, "Metric", crisis.metric_names)
+    summary["Mean"] = totals / entities if entities else np.nan
+
+    worst = pd.DataFrame(columns=[ENTITY_COLUMN, "Breaches", "Shortfall"] + list(crisis.metric_names))
+    if candidates:
+        names = [name for chunk in candidates for name in chunk[0]]
+        shortfall = np.concatenate([chunk[1] for chunk in candidates])
+        breaches = np.concatenate([chunk[2] for chunk in candidates])
+        adjusted = np.concatenate([chunk[3] for chunk in candidates])
+        order = np.argsort(-shortfall, kind="stable")[:top_n]
+        worst = pd.DataFrame(adjusted[order], columns=list(crisis.metric_names))
+        worst.insert(0, "Shortfall", shortfall[order])
+        worst.insert(0, "Breaches", breaches[order])
+        worst.insert(0, ENTITY_COLUMN, [names[i] for i in order])
+    return PortfolioImpact(crisis.id, entities, edges, histograms, summary, worst)
+
+
+_impacts = OrderedDict()
+_impacts_lock = threading.Lock()
+
+
+# Portfolio impact of a crisis, computed once per version of the portfolio
+# file and shared by every session, so switching back to a crisis is a lookup
+def get_portfolio_impact(path, crisis, top_n=DEFAULT_TOP_N):
+    key = (path, _file_stamp(path), crisis.id, top_n)
+    with _impacts_lock:
+        impact = _impacts.get(key)
+        if impact is not None:
+            _impacts.move_to_end(key)
+            return impact
+
+    impact = portfolio_impact(get_portfolio(path), crisis, top_n=top_n)
+    with _impacts_lock:
+        _impacts[key] = impact
+        while len(_impacts) > _MAX_CACHED_IMPACTS:
+            _impacts.popitem(last=False)
+    return impact
@@ -0,0 +1,215 @@
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from instrumentation import timed
+from pandemic_model import (PANDEMIC_COEFFICIENTS, PANDEMIC_METRICS, predict_pandemic_batch,
+                            predict_pandemic_with_coefficients, predictions_frame)
+
+# Columns of a scenario/outcome history file: the four slider inputs, then one column per predicted metric
+INPUT_COLUMNS = ["Pandemic Severity", "Remote Work Factor", "Healthcare Investment", "Lockdown Duration"]
+HISTORY_COLUMNS = INPUT_COLUMNS + PANDEMIC_METRICS
+
+MODEL_DIR = os.environ.get("PANDEMIC_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "models"))
+DEFAULT_CHUNK_SIZE = 1_000_000
+# Prior weight of the starting coefficients when no history has been seen yet
+_PRIOR_PRECISION = 1e-6
+
+_ARTIFACT_PATTERN = re.compile(r"^pandemic_model_v(\d+)\.npz$")
+
+
+def _design_matrix(inputs):
+    inputs = np.asarray(inputs, dtype=np.float64).reshape(-1, len(INPUT_COLUMNS))
+    return np.hstack([np.ones((inputs.shape[0], 1)), inputs])
+
+
+# Linear model of the pandemic metrics: coefficients has one row per metric
+# (intercept first, then one weight per input), information is the accumulated
+# X^T X that recursive least squares updates build on.
+class PandemicRegressionModel:
+    def __init__(self, coefficients, information, n_observations=0, version=0):
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.information = np.asarray(information, dtype=np.float64)
+        self.n_observations = int(n_observations)
+        self.version = int(version)
+
+    # The hand-written formulas the page shipped with, used until a fitted artifact exists
+    @classmethod
+    def default(cls):
+        return cls(PANDEMIC_COEFFICIENTS.copy(), np.eye(PANDEMIC_COEFFICIENTS.shape[1]) * _PRIOR_PRECISION)
+
+    # Fit by least squares from (inputs, outcomes) chunks. Only X^T X and X^T Y
+    # are accumulated, so memory does not depend on the history length.
+    @classmethod
+    def fit(cls, chunks):
+        n_features = len(INPUT_COLUMNS) + 1
+        gram = np.zeros((n_features, n_features))
+        moments = np.zeros((n_features, len(PANDEMIC_METRICS)))
+        n_observations = 0
+        for inputs, outcomes in chunks:
+            x = _design_matrix(inputs)
+            gram += x.T @ x
+            moments += x.T @ np.asarray(outcomes, dtype=np.float64)
+            n_observations += x.shape[0]
+        if n_observations == 0:
+            raise ValueError("Cannot fit the pandemic model without observations")
+
+        theta = np.linalg.lstsq(gram, moments, rcond=None)[0]
+        return cls(theta.T, gram, n_observations)
+
+    def copy(self):
+        return PandemicRegressionModel(self.coefficients.copy(), self.information.copy(), self.n_observations,
+                                       self.version)
+
+    # Fold new observations in with a block recursive least squares step.
+    # Gives the same coefficients as refitting on the whole history, at the
+    # cost of the new rows only.
+    def update(self, inputs, outcomes):
+        x = _design_matrix(inputs)
+        y = np.asarray(outcomes, dtype=np.float64).reshape(x.shape[0], len(PANDEMIC_METRICS))
+        if x.shape[0] == 0:
+            return self
+
+        theta = self.coefficients.T
+        information = self.information + x.T @ x
+        theta = theta + np.linalg.lstsq(information, x.T @ (y - x @ theta), rcond=None)[0]
+        self.coefficients = theta.T
+        self.information = information
+        self.n_observations += x.shape[0]
+        return self
+
+    # One (scenarios x 4) input matrix in, one (scenarios x metrics) prediction matrix out
+    def predict(self, inputs):
+        return predict_pandemic_with_coefficients(
+            np.asarray(inputs, dtype=np.float64).reshape(-1, len(INPUT_COLUMNS)), self.coefficients)
+
+
+def _is_parquet(source):
+    name = str(getattr(source, "name", source)).lower()
+    return name.endswith((".parquet", ".pq"))
+
+
+# Read a scenario/outcome history file as (inputs, outcomes) chunks
+def iter_history_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    if _is_parquet(source):
+        parquet_file = pq.ParquetFile(source)
+        missing = [name for name in HISTORY_COLUMNS if name not in parquet_file.schema_arrow.names]
+        if missing:
+            raise ValueError(f"History file is missing columns: {', '.join(missing)}")
+        batches = parquet_file.iter_batches(batch_size=chunk_size, columns=HISTORY_COLUMNS)
+    else:
+        batches = pa_csv.open_csv(
+            source,
+            read_options=pa_csv.ReadOptions(block_size=chunk_size * 64),
+            convert_options=pa_csv.ConvertOptions(include_columns=HISTORY_COLUMNS,
+                                                  column_types={name: pa.float64() for name in HISTORY_COLUMNS}),
+        )
+
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        table = np.column_stack([batch.column(name).cast(pa.float64()).to_numpy(zero_copy_only=False)
+                                 for name in HISTORY_COLUMNS])
+        # Rows with any missing value carry no usable observation
+        table = table[~np.isnan(table).any(axis=1)]
+        yield table[:, :len(INPUT_COLUMNS)], table[:, len(INPUT_COLUMNS):]
+
+
+@timed("compute")
+def fit_model_from_file(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    return PandemicRegressionModel.fit(iter_history_chunks(source, chunk_size=chunk_size))
+
+
+@timed("compute")
+def update_model_from_file(model, source, chunk_size=DEFAULT_CHUNK_SIZE):
+    for inputs, outcomes in iter_history_chunks(source, chunk_size=chunk_size):
+        model.update(inputs, outcomes)
+    return model
+
+
+def _artifact_versions(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(match.group(1)) for match in map(_ARTIFACT_PATTERN.match, os.listdir(directory)) if match)
+
+
+# Write the model as the next numbered artifact and make it the active one.
+# Safe against concurrent saves from other sessions or processes: each one
+# claims its own version number.
+@timed("compute")
+def save_model(model, directory=MODEL_DIR):
+    os.makedirs(directory, exist_ok=True)
+
+    # Write to a temporary file of our own first so readers never see a partial artifact
+    descriptor, temporary_path = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(descriptor, "wb") as artifact:
+            np.savez(artifact, coefficients=model.coefficients, information=model.information,
+                     n_observations=model.n_observations, metrics=np.array(PANDEMIC_METRICS), saved_at=time.time())
+        # Linking fails if the name exists, so a version taken by a concurrent save is never overwritten
+        while True:
+            versions = _artifact_versions(directory)
+            version = (versions[-1] if versions else 0) + 1
+            path = os.path.join(directory, f"pandemic_model_v{version}.npz")
+            try:
+                os.link(temporary_path, path)
+                break
+            except FileExistsError:
+                continue
+    finally:
+        os.remove(temporary_path)
+    model.version = version
+
+    # A slower concurrent save of an older version does not replace a newer active model
+    with _active_lock:
+        active = _active_models.get(directory)
+        if active is None or active.version < model.version:
+            _active_models[directory] = model
+    return path
+
+
+def load_model(path):
+    with np.load(path) as artifact:
+        if list(artifact["metrics"]) != PANDEMIC_METRICS:
+            raise ValueError(f"{path} was trained for different metrics")
+        version = int(_ARTIFACT_PATTERN.match(os.path.basename(path)).group(1))
+        return PandemicRegressionModel(artifact["coefficients"], artifact["information"],
+                                       int(artifact["n_observations"]), version)
+
+
+_active_models = {}
+_active_lock = threading.Lock()
+
+
+# Latest saved model, loaded once per process and shared by every session.
+# Falls back to the hand-written formulas when nothing has been trained yet.
+def get_active_model(directory=MODEL_DIR):
+    with _active_lock:
+        model = _active_models.get(directory)
+        if model is None:
+            versions = _artifact_versions(directory)
+            if versions:
+                model = load_model(os.path.join(directory, f"pandemic_model_v{versions[-1]}.npz"))
+            else:
+                model = PandemicRegressionModel.default()
+            _active_models[directory] = model
+        return model
+
+
+# Function to predict impact based on parameters
+@timed("compute")
+def predict_pandemic_impact(severity, remote_work, healthcare_investment, lockdown_duration):
+    # The batch engine in pandemic_model, with the active model's coefficients
+    impact = predict_pandemic_batch(severity, remote_work, healthcare_investment, lockdown_duration)[0]
+
+    # Create a DataFrame to display the results
+    df = predictions_frame(impact)
+
+    return df
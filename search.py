@@ -0,0 +1,133 @@
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+from instrumentation import timed
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Matches found by prefix or by a one-character typo score lower than exact ones
+PREFIX_WEIGHT = 0.7
+TYPO_WEIGHT = 0.5
+MAX_EXPANSIONS = 32
+MIN_PREFIX_LENGTH = 2
+MIN_TYPO_LENGTH = 4
+
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def _deletes(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+# Damerau-Levenshtein distance of at most one, without computing the full distance
+def _within_one_edit(a, b):
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return (a[i + 1:] == b[i + 1:]
+                or (i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]))
+    return a[i:] == b[i + 1:]
+
+
+# Inverted index over short documents with BM25 ranking. Each document is a
+# dict with at least "title" and "text", and optionally extra "keywords" that
+# are searchable but not displayed; titles count twice. Per-posting BM25
+# weights are computed once at build time, so a query only adds up arrays.
+class SearchIndex:
+    def __init__(self, documents):
+        self.documents = list(documents)
+        term_frequencies = []
+        lengths = np.empty(len(self.documents))
+        for doc_id, document in enumerate(self.documents):
+            tokens = (tokenize(document["title"]) * 2 + tokenize(document["text"])
+                      + tokenize(document.get("keywords", "")))
+            lengths[doc_id] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            term_frequencies.append(counts)
+
+        postings = {}
+        for doc_id, counts in enumerate(term_frequencies):
+            for term, count in counts.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(doc_id)
+                postings[term][1].append(count)
+
+        n_documents = len(self.documents)
+        average_length = lengths.mean() if n_documents else 0.0
+        self._postings = {}
+        for term, (doc_ids, counts) in postings.items():
+            doc_ids = np.array(doc_ids, dtype=np.int64)
+            tf = np.array(counts, dtype=np.float64)
+            idf = np.log(1 + (n_documents - doc_ids.shape[0] + 0.5) / (doc_ids.shape[0] + 0.5))
+            norm = K1 * (1 - B + B * lengths[doc_ids] / average_length)
+            self._postings[term] = (doc_ids, idf * tf * (K1 + 1) / (tf + norm))
+
+        # Sorted vocabulary for prefix lookups and a delete-neighbourhood map for typos
+        self._vocabulary = sorted(self._postings)
+        self._typo_candidates = {}
+        for term in self._vocabulary:
+            if len(term) >= MIN_TYPO_LENGTH:
+                for variant in _deletes(term) | {term}:
+                    self._typo_candidates.setdefault(variant, []).append(term)
+
+    def __len__(self):
+        return len(self.documents)
+
+    # Index terms a query token can stand for, with the weight of each match
+    def _expand(self, token, is_last):
+        expansions = {}
+        if token in self._postings:
+            expansions[token] = 1.0
+
+        # Only the token being typed is completed as a prefix
+        if is_last and len(token) >= MIN_PREFIX_LENGTH:
+            start = bisect_left(self._vocabulary, token)
+            for term in self._vocabulary[start:start + MAX_EXPANSIONS]:
+                if not term.startswith(token):
+                    break
+                expansions.setdefault(term, PREFIX_WEIGHT)
+
+        if len(token) >= MIN_TYPO_LENGTH and len(expansions) < MAX_EXPANSIONS:
+            candidates = set()
+            for variant in _deletes(token) | {token}:
+                candidates.update(self._typo_candidates.get(variant, ()))
+            for term in candidates:
+                if term not in expansions and _within_one_edit(token, term):
+                    expansions[term] = TYPO_WEIGHT
+        return expansions
+
+    # Top documents for a free-text query as (score, document) pairs, best first
+    @timed("compute")
+    def search(self, query, limit=10):
+        tokens = tokenize(query)
+        if not tokens or not self.documents:
+            return []
+
+        scores = np.zeros(len(self.documents))
+        for position, token in enumerate(tokens):
+            for term, weight in self._expand(token, position == len(tokens) - 1).items():
+                doc_ids, term_scores = self._postings[term]
+                scores[doc_ids] += weight * term_scores
+
+        matched = np.flatnonzero(scores)
+        if matched.shape[0] > limit:
+            matched = matched[np.argpartition(-scores[matched], limit - 1)[:limit]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(float(scores[doc_id]), self.documents[doc_id]) for doc_id in matched]
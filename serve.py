@@ -0,0 +1,16 @@
+import os
+import sys
+
+from streamlit.web import cli
+
+from warm_cache import start_warmup
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "AI.py")
+
+# Fill the warm cache, then start the Streamlit server for AI.py in the same
+# process, so the first session after a deploy is served from a warm cache.
+# Arguments are passed on to "streamlit run", e.g. python serve.py --server.port 8080
+if __name__ == "__main__":
+    start_warmup().wait()
+    sys.argv = ["streamlit", "run", APP_PATH] + sys.argv[1:]
+    sys.exit(cli.main())
@@ -0,0 +1,48 @@
+import numpy as np
+
+from pandemic_model import (HEALTHCARE_INVESTMENT_RANGE, PANDEMIC_COEFFICIENTS, REMOTE_WORK_RANGE, SEVERITY_RANGE,
+                            iter_pandemic_impact_grid, predict_pandemic_batch, predict_pandemic_with_coefficients)
+
+
+# The original per-click formulas of the Predictive Analytics page
+def original_formulas(severity, remote_work, healthcare_investment, lockdown_duration):
+    return np.maximum(np.column_stack([
+        100 - severity * 0.5 + remote_work * 0.3 - healthcare_investment * 0.2 + lockdown_duration * 0.1,
+        50 - severity * 0.4 + healthcare_investment * 0.5 - lockdown_duration * 0.3,
+        60 + severity * 0.6 - remote_work * 0.2 + healthcare_investment * 0.1,
+        remote_work * 0.7 + healthcare_investment * 0.2,
+        70 - severity * 0.5 + healthcare_investment * 0.3,
+    ]), 0)
+
+
+def assert_bitwise_equal(actual, expected):
+    assert actual.shape == expected.shape
+    assert np.array_equal(actual.view(np.uint64), expected.view(np.uint64))
+
+
+def test_batch_matches_original_formulas_on_slider_grid():
+    for params, impact in iter_pandemic_impact_grid(lockdown_duration=[1, 12, 26, 52], chunk_size=250_000,
+                                                    coefficients=PANDEMIC_COEFFICIENTS):
+        assert_bitwise_equal(impact, original_formulas(*params))
+
+
+def test_batch_matches_original_formulas_off_grid():
+    rng = np.random.default_rng(7)
+    low = [SEVERITY_RANGE[0], REMOTE_WORK_RANGE[0], HEALTHCARE_INVESTMENT_RANGE[0], 1]
+    high = [SEVERITY_RANGE[1], REMOTE_WORK_RANGE[1], HEALTHCARE_INVESTMENT_RANGE[1], 52]
+    params = rng.uniform(low, high, (100_000, 4)).T
+    assert_bitwise_equal(predict_pandemic_batch(*params, coefficients=PANDEMIC_COEFFICIENTS),
+                         original_formulas(*params))
+
+
+def test_single_scenario_matches_original_formulas():
+    expected = original_formulas(*(np.array([value], dtype=np.float64) for value in (50, 50, 50, 12)))
+    assert_bitwise_equal(predict_pandemic_batch(50, 50, 50, 12, coefficients=PANDEMIC_COEFFICIENTS), expected)
+
+
+def test_coefficient_matrix_and_batch_agree():
+    rng = np.random.default_rng(11)
+    inputs = rng.uniform(0, 100, (1_000, 4))
+    coefficients = PANDEMIC_COEFFICIENTS * rng.uniform(0.5, 1.5, PANDEMIC_COEFFICIENTS.shape)
+    assert_bitwise_equal(predict_pandemic_with_coefficients(inputs, coefficients),
+                         predict_pandemic_batch(*inputs.T, coefficients=coefficients))
@@ -0,0 +1,181 @@
+import csv
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from instrumentation import timed
+
+# Validation outcomes, indexed by the codes returned from classify_values
+VALIDATION_LABELS = ["Below Minimum", "Within Range", "Above Maximum", "Missing Value", "No Rule"]
+BELOW_MINIMUM, WITHIN_RANGE, ABOVE_MAXIMUM, MISSING_VALUE, NO_RULE = 0, 1, 2, 3, 4
+
+# Threshold Min / Max rules used by the Quality Assurance page
+METRIC_THRESHOLDS = {
+    "Supply Chain Efficiency": (50, 80),
+    "Profit Margins": (40, 70),
+    "Logistics Costs": (30, 60),
+    "Cybersecurity Threat Level": (60, 90),
+    "Economic Confidence": (50, 75),
+    "Lead Time": (30, 60),
+    "Demand Forecasting Accuracy": (50, 80),
+    "COGS": (30, 60),
+    "Warehouse Utilization": (40, 75),
+}
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+# Rough width of one exported CSV row, used to turn a row count into a read block size
+_CSV_BYTES_PER_ROW = 48
+
+_FILE_COLUMNS = ["Metric", "Value", "Threshold Min", "Threshold Max"]
+
+
+# Classify values against their thresholds with column operations.
+# Matches validate_metric: a value below the minimum wins over one above the
+# maximum, and a missing bound only skips its own comparison. Rows without a
+# value are Missing Value; rows with neither a finite minimum nor a finite
+# maximum (NaN, or the infinite bounds of crisis metrics) are No Rule.
+def classify_values(values, threshold_min, threshold_max):
+    values = np.asarray(values, dtype=np.float64)
+    threshold_min = np.asarray(threshold_min, dtype=np.float64)
+    threshold_max = np.asarray(threshold_max, dtype=np.float64)
+    below = values < threshold_min
+    above = values > threshold_max
+    no_rule = ~(np.isfinite(threshold_min) | np.isfinite(threshold_max))
+    codes = np.full(values.shape, WITHIN_RANGE, dtype=np.int8)
+    codes[above] = ABOVE_MAXIMUM
+    codes[below] = BELOW_MINIMUM
+    codes[np.broadcast_to(no_rule, values.shape)] = NO_RULE
+    codes[np.isnan(values)] = MISSING_VALUE
+    return codes
+
+
+# Add the Validation column to a Metric / Value / Threshold Min / Threshold Max frame
+@timed("compute")
+def validate_frame(df):
+    codes = classify_values(df["Value"].to_numpy(dtype=np.float64),
+                            df["Threshold Min"].to_numpy(dtype=np.float64),
+                            df["Threshold Max"].to_numpy(dtype=np.float64))
+    df["Validation"] = pd.Categorical.from_codes(codes, VALIDATION_LABELS)
+    return df
+
+
+def _is_parquet(source):
+    name = str(getattr(source, "name", source)).lower()
+    return name.endswith((".parquet", ".pq"))
+
+
+# Column names on the first line of a CSV file; uploaded files are rewound afterwards
+def _csv_header(source):
+    if hasattr(source, "read"):
+        position = source.tell()
+        header = source.readline()
+        source.seek(position)
+    else:
+        with open(source, "rb") as csv_file:
+            header = csv_file.readline()
+    return next(csv.reader([header.decode("utf-8-sig")]), [])
+
+
+# Read a CSV or Parquet metric file as Arrow record batches of about chunk_size rows
+def iter_metric_batches(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    if _is_parquet(source):
+        parquet_file = pq.ParquetFile(source)
+        columns = [name for name in _FILE_COLUMNS if name in parquet_file.schema_arrow.names]
+        if "Metric" not in columns or "Value" not in columns:
+            raise ValueError("Metric files need at least a 'Metric' and a 'Value' column")
+        yield from parquet_file.iter_batches(batch_size=chunk_size, columns=columns)
+    else:
+        header = _csv_header(source)
+        columns = [name for name in _FILE_COLUMNS if name in header]
+        if "Metric" not in columns or "Value" not in columns:
+            raise ValueError("Metric files need at least a 'Metric' and a 'Value' column")
+        reader = pa_csv.open_csv(
+            source,
+            read_options=pa_csv.ReadOptions(block_size=chunk_size * _CSV_BYTES_PER_ROW),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=columns,
+                column_types={"Metric": pa.string(), "Value": pa.float64(),
+                              "Threshold Min": pa.float64(), "Threshold Max": pa.float64()},
+            ),
+        )
+        yield from reader
+
+
+def _column_values(batch, name):
+    index = batch.schema.get_field_index(name)
+    if index < 0:
+        return None
+    column = batch.column(index)
+    if column.null_count == len(column):
+        return None
+    return column.cast(pa.float64()).to_numpy(zero_copy_only=False)
+
+
+# Resolve per-row thresholds: values in the file win, the rules table fills the gaps
+def _batch_thresholds(batch, metric_index, metric_names, thresholds):
+    catalog = np.array([thresholds.get(name, (np.nan, np.nan)) for name in metric_names],
+                       dtype=np.float64).reshape(-1, 2)
+    resolved = []
+    for position, name in enumerate(["Threshold Min", "Threshold Max"]):
+        from_catalog = catalog[metric_index, position]
+        from_file = _column_values(batch, name)
+        if from_file is None:
+            resolved.append(from_catalog)
+        else:
+            resolved.append(np.where(np.isnan(from_file), from_catalog, from_file))
+    return resolved
+
+
+# Stream per-metric violation counts for a metric file. After every chunk,
+# yields (rows validated so far, counts table) where the table has one row per
+# metric and one column per validation label. Memory stays bounded by the
+# chunk size whatever the file length.
+@timed("compute")
+def iter_validation_counts(source, thresholds=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    thresholds = METRIC_THRESHOLDS if thresholds is None else thresholds
+    metric_ids = {}
+    counts = np.zeros((0, len(VALIDATION_LABELS)), dtype=np.int64)
+    rows = 0
+
+    for batch in iter_metric_batches(source, chunk_size=chunk_size):
+        if batch.num_rows == 0:
+            continue
+
+        # Metric names are dictionary encoded so the per-row work stays numeric
+        metric = pc.fill_null(batch.column(batch.schema.get_field_index("Metric")).cast(pa.string()), "")
+        encoded = metric.dictionary_encode()
+        local_names = encoded.dictionary.to_pylist()
+        local_index = encoded.indices.to_numpy(zero_copy_only=False)
+
+        # An all-null Value column counts every row as Missing Value
+        values = _column_values(batch, "Value")
+        if values is None:
+            values = np.full(batch.num_rows, np.nan)
+        threshold_min, threshold_max = _batch_thresholds(batch, local_index, local_names, thresholds)
+        codes = classify_values(values, threshold_min, threshold_max)
+
+        for name in local_names:
+            metric_ids.setdefault(name, len(metric_ids))
+        if counts.shape[0] < len(metric_ids):
+            counts = np.vstack([counts, np.zeros((len(metric_ids) - counts.shape[0], counts.shape[1]),
+                                                 dtype=np.int64)])
+        global_index = np.array([metric_ids[name] for name in local_names], dtype=np.int64)[local_index]
+        counts += np.bincount(global_index * len(VALIDATION_LABELS) + codes,
+                              minlength=counts.size).reshape(counts.shape)
+
+        rows += batch.num_rows
+        yield rows, pd.DataFrame(counts, index=pd.Index(list(metric_ids), name="Metric"),
+                                 columns=VALIDATION_LABELS)
+
+
+# Validate a whole metric file and return the final per-metric counts table
+@timed("compute")
+def validate_metric_file(source, thresholds=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    result = pd.DataFrame(columns=VALIDATION_LABELS, index=pd.Index([], name="Metric"), dtype=np.int64)
+    for _, result in iter_validation_counts(source, thresholds=thresholds, chunk_size=chunk_size):
+        pass
+    return result
@@ -0,0 +1,186 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from charts import metrics_chart, predictions_chart
+from instrumentation import timed
+from metric_registry import DEFAULT_SUPPLY_CHAIN_SUBHEADER, REGISTRY_PATH, get_registry, reload_registry
+from pandemic_model import predict_pandemic_batch, predictions_frame
+from regression import get_active_model, predict_pandemic_impact
+from search import SearchIndex
+
+# Coarse grid of slider values predicted ahead of time. It includes the
+# slider defaults, so the first prediction of every session is a lookup.
+SEVERITY_GRID = tuple(range(0, 101, 10))
+REMOTE_WORK_GRID = tuple(range(0, 101, 10))
+HEALTHCARE_INVESTMENT_GRID = tuple(range(0, 101, 10))
+LOCKDOWN_DURATION_GRID = (1, 4, 8, 12, 16, 26, 39, 52)
+DEFAULT_SCENARIO = (50, 50, 50, 12)
+
+WARMUP_WORKERS = min(4, os.cpu_count() or 1)
+
+
+# Predictions of one model over the coarse grid, shared read-only by every session
+class PredictionGrid:
+    def __init__(self, model):
+        self.model = model
+        axes = [SEVERITY_GRID, REMOTE_WORK_GRID, HEALTHCARE_INVESTMENT_GRID, LOCKDOWN_DURATION_GRID]
+        self._positions = [{value: position for position, value in enumerate(axis)} for axis in axes]
+        inputs = [grid.ravel() for grid in np.meshgrid(*axes, indexing="ij")]
+        impact = predict_pandemic_batch(*inputs, coefficients=model.coefficients)
+        self.impact = impact.reshape(tuple(len(axis) for axis in axes) + (impact.shape[1],))
+        self.impact.flags.writeable = False
+
+    # Predicted impact row for slider values on the grid, None for values between grid points
+    def lookup(self, *scenario):
+        try:
+            index = tuple(positions[value] for positions, value in zip(self._positions, scenario))
+        except KeyError:
+            return None
+        return self.impact[index]
+
+
+# Everything that is identical for every user: the compiled crisis registry
+# (whose definitions markdown is prebuilt), the rendered crisis charts, the
+# Dashboard search index, the prediction grid and the chart of the default
+# prediction. A thread pool fills it in the background; invalidate() drops
+# parts of it and fills them again.
+class WarmCache:
+    def __init__(self, workers=WARMUP_WORKERS, registry_path=REGISTRY_PATH):
+        self.workers = workers
+        self.registry_path = registry_path
+        self._grid = None
+        self._search_index = None
+        self._registry_stamp = None
+        self._futures = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                self._registry_stamp = _file_stamp(self.registry_path)
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="WarmCache")
+                self._submit("crisis_views", self._warm_crisis_views)
+                self._submit("predictions", self._warm_predictions)
+        return self
+
+    def _submit(self, name, task):
+        self._futures[name] = self._executor.submit(task)
+
+    # Compile the registry, render the chart of every crisis into the shared
+    # chart cache and build the search index
+    @timed("warmup")
+    def _warm_crisis_views(self):
+        for crisis in get_registry():
+            metrics_chart(crisis.impact_title, crisis.metric_names, crisis.values)
+        self.search_index()
+
+    @timed("warmup")
+    def _warm_predictions(self):
+        grid = PredictionGrid(get_active_model())
+        self._grid = grid
+        predictions_chart(predictions_frame(grid.lookup(*DEFAULT_SCENARIO)))
+
+    # Block until the warm-up tasks submitted so far have finished
+    def wait(self, timeout=None):
+        with self._lock:
+            futures = list(self._futures.values())
+        wait(futures, timeout=timeout)
+        for future in futures:
+            if future.done():
+                future.result()
+
+    # Name of each warm-up task and whether it has finished
+    def status(self):
+        with self._lock:
+            return {name: future.done() for name, future in self._futures.items()}
+
+    # Predicted Impact table from the grid when the sliders sit on it and the
+    # grid was built for the active model, computed directly otherwise
+    def prediction(self, severity, remote_work, healthcare_investment, lockdown_duration):
+        grid = self._grid
+        if grid is not None and grid.model is get_active_model():
+            impact = grid.lookup(severity, remote_work, healthcare_investment, lockdown_duration)
+            if impact is not None:
+                return predictions_frame(impact)
+        return predict_pandemic_impact(severity, remote_work, healthcare_investment, lockdown_duration)
+
+    # Search index over the crisis metrics, rebuilt when the registry was reloaded
+    def search_index(self):
+        registry = get_registry()
+        cached = self._search_index
+        if cached is None or cached[0] is not registry:
+            cached = (registry, SearchIndex(crisis_search_documents(registry)))
+            self._search_index = cached
+        return cached[1]
+
+    # Drop what depends on changed source data and warm it again: "crisis_views"
+    # after editing the crisis metrics file, "predictions" after saving a model
+    def invalidate(self, *parts):
+        parts = parts or ("crisis_views", "predictions")
+        with self._lock:
+            if "crisis_views" in parts:
+                reload_registry()
+                self._search_index = None
+            if "predictions" in parts:
+                self._grid = None
+            if self._executor is not None:
+                if "crisis_views" in parts:
+                    self._submit("crisis_views", self._warm_crisis_views)
+                if "predictions" in parts:
+                    self._submit("predictions", self._warm_predictions)
+
+    # Invalidate the crisis views once the crisis metrics file changed on disk
+    # since they were warmed; returns whether it had changed
+    def check_registry(self):
+        stamp = _file_stamp(self.registry_path)
+        with self._lock:
+            if stamp == self._registry_stamp:
+                return False
+            self._registry_stamp = stamp
+        self.invalidate("crisis_views")
+        return True
+
+
+def _file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Everything the Dashboard query can find: crisis impact metrics, supply chain
+# definitions and metric formulas
+def crisis_search_documents(registry):
+    documents = []
+    for entry in registry.default_supply_chain:
+        documents.append({"title": entry["name"], "text": entry["description"],
+                          "source": DEFAULT_SUPPLY_CHAIN_SUBHEADER})
+    for crisis in registry:
+        for metric, description in zip(crisis.metric_names, crisis.descriptions):
+            documents.append({"title": metric, "text": description, "source": crisis.impact_title,
+                              "keywords": crisis.label})
+        for entry in crisis.supply_chain_updates:
+            documents.append({"title": entry["name"], "text": entry["description"],
+                              "source": crisis.supply_chain_subheader, "keywords": crisis.label})
+        for definition in crisis.definitions:
+            documents.append({"title": definition.name, "text": definition.description,
+                              "source": crisis.definitions_subheader, "formula": definition.formula,
+                              "keywords": f"{crisis.label} formula " + re.sub(r"\\[a-z]+", " ", definition.formula)})
+    return documents
+
+
+warm_cache = WarmCache()
+
+
+# Start filling the warm cache once per process. Later calls return at once,
+# after invalidating the crisis views if the crisis metrics file changed.
+def start_warmup():
+    warm_cache.start()
+    warm_cache.check_registry()
+    return warm_cache